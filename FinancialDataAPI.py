@@ -1,582 +1,3117 @@
 import pandas as pd
 import numpy as np
 import os
-from datetime import date, datetime, timedelta
+import re
+import ast
+import sys
+import copy
+import io
+import json
+import hashlib
+import shutil
+import time
+import threading
+import asyncio
+import functools
+import inspect
+import importlib.util
+import contextlib
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import date, datetime
 
 
-class FinancialDataAPI:
-    __data_dict = None
-    __field_meta = None
-    __date_format = '%Y-%m-%d'
-    
-    def __init__(self, source='./data', sep=';'):
-        if FinancialDataAPI.__data_dict is None:
-            # Load all raw data sets
-            files = [f for f in os.listdir('./data') if f[0] != '.']
-            FinancialDataAPI.__data_dict = {f.replace('.csv', '').replace('us-', ''): pd.read_csv('{}/{}'.format(source, f), sep=sep) for f in files}
-
-            # Convert the date columns into the datetime64 type
-            for data_set in FinancialDataAPI.__data_dict:
-                df = FinancialDataAPI.__data_dict[data_set]
-                for col in list(df.columns):
-                    if 'date' in col.lower():
-                        df[col] = df[col].astype('datetime64[ns]')
-                    
-        
-        if FinancialDataAPI.__field_meta is None:
-            # load fields metadata
-            FinancialDataAPI.__field_meta = pd.read_csv('./meta/fields-meta.csv').fillna('')
-    
+class DataSetChangedError(Exception):
+    """
+        The error raised when a data set is read from a file which has changed since the data sets were registered
+        (see DataSetRegistry). The queries of FinancialDataAPI refresh the data sets and run again on this error.
+    """
+
+
+class DataSetRegistry:
+    """
+        The registry of the raw data sets. It works like a read only dictionary of data set name -> dataframe.
+        A data set is only read from the drive the first time it is requested.
+    """
     
-    def reload_data_sets_and_meta(self, source='./data', sep=';'):
+    def __init__(self, files, loader, signature=None):
         """
-            The function reloads the raw data sets and data meta from the drive.
+            files: dictionary of data set name -> file path
+            loader: function which reads a data set from the file path
+            signature: function which returns the signature of a file path (e.g. its size and modification time).
+            If given, the signatures are taken now and a data set whose file has changed since is not read,
+            so the data sets of a registry always come from the same version of the files.
         """
         
-        # Load all raw data sets
-        files = [f for f in os.listdir('./data') if f[0] != '.']
-        FinancialDataAPI.__data_dict = {f.replace('.csv', '').replace('us-', ''): pd.read_csv('{}/{}'.format(source, f), sep=sep) for f in files}
-
-        # Convert the date columns into the datetime64 type
-        for data_set in FinancialDataAPI.__data_dict:
-            df = FinancialDataAPI.__data_dict[data_set]
-            for col in list(df.columns):
-                if 'date' in col.lower():
-                    df[col] = df[col].astype('datetime64[ns]')
-        
-        # load fields metadata
-        FinancialDataAPI.__field_meta = pd.read_csv('./meta/fields-meta.csv').fillna('')
+        self.__files = files
+        self.__loader = loader
+        self.__signature = signature
+        self.__signatures = {name: signature(path) for name, path in files.items()} if signature is not None else {}
+        self.__data = {}
+        self.__locks = {name: threading.Lock() for name in files}
+        self.__derived = {}
+        self.__derived_deps = {}
+        self.__derived_lock = threading.RLock() # a builder may use another derived structure
     
     
-    def list_fields(self):
-        """
-            The function shows the full list of fields
-        """
-        
-        df = FinancialDataAPI.__field_meta[['Long Name', 'Short Name', 'func', 'doc']].copy()
-        df['func'] = df['func'].str[4:]
-        df = df.rename(columns={'func': 'Category', 'doc': 'Quick Document'})
+    def __getitem__(self, name):
+        if name not in self.__data:
+            if name not in self.__files:
+                raise KeyError(name)
+            
+            # one lock per data set, so different data sets can be loaded at the same time
+            with self.__locks[name]:
+                if name not in self.__data:
+                    self.__data[name] = self.__load(name)
         
-        return df.copy()
+        return self.__data[name]
     
     
-    def list_data_category(self):
+    def __load(self, name):
         """
-            The function lists all the data categories available
+            The function reads a data set. The signature of the file is checked before and after the read,
+            so a file rewritten since the registry was created (e.g. by the update before a refresh) is not mixed
+            with the data sets read before.
         """
         
-        return [cat.replace('get_', '') for cat in FinancialDataAPI.__field_meta['func'].unique().tolist()]
+        path = self.__files[name]
         
-    
-    def list_fields_by_category(self, category_list):
-        """
-            The function returns a list of fields for a given category list
-            category_list: list of categories
-        """
+        if self.__signature is None:
+            return self.__loader(path)
         
-        category_list = [f'get_{cat}' for cat in category_list]
-        df = FinancialDataAPI.__field_meta[FinancialDataAPI.__field_meta['func'].isin(category_list)]
-        df = df[['Long Name', 'Short Name', 'func', 'doc']]
-        df['func'] = df['func'].str[4:]
-        df = df.rename(columns={'func': 'Category', 'doc': 'Quick Document'})
+        if self.__signature(path) != self.__signatures[name]:
+            raise DataSetChangedError('Err: The file of the data set {} has changed since the data was loaded, call refresh_data_sets.'.format(name))
         
-        return df.copy()
+        df = self.__loader(path)
+        
+        if self.__signature(path) != self.__signatures[name]:
+            raise DataSetChangedError('Err: The file of the data set {} has changed while it was read, call refresh_data_sets.'.format(name))
+        
+        return df
+    
+    
+    def __contains__(self, name):
+        return name in self.__files
+    
+    
+    def __iter__(self):
+        return iter(self.__files)
+    
+    
+    def __len__(self):
+        return len(self.__files)
+    
+    
+    def keys(self):
+        return self.__files.keys()
+    
+    
+    def path_of(self, name):
+        return self.__files[name]
+    
+    
+    def signature_of(self, name):
+        return self.__signatures.get(name)
     
     
-    def list_data_sets(self):
+    def is_loaded(self, name):
+        return name in self.__data
+    
+    
+    def preload(self, names, workers=1):
         """
-            The function retuns a list of names of the raw data sets.
+            The function loads the given data sets if they are not loaded yet.
+            With more than one worker, the data sets are loaded at the same time by a thread pool.
         """
         
-        return list(FinancialDataAPI.__data_dict.keys())
+        if workers <= 1 or len(names) <= 1:
+            for name in names:
+                self[name]
+            return
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # list() raises the first error of the workers
+            list(executor.map(self.__getitem__, names))
     
     
-    def get_data_set(self, data_set):
+    def derived(self, key, builder, depends_on=None):
         """
-            The function returns raw data set for a given name of the data set.
+            The function returns a structure derived from the data sets, e.g. an index.
+            The structure is built by calling builder() the first time the key is requested
+            and lives as long as the registry, i.e. until the data sets are reloaded.
+            depends_on: the names of the data sets the structure is built from, None if it may use any data set
         """
         
-        return FinancialDataAPI.__data_dict[data_set]
+        if key not in self.__derived:
+            with self.__derived_lock:
+                if key not in self.__derived:
+                    self.__derived_deps[key] = depends_on
+                    self.__derived[key] = builder()
+        
+        return self.__derived[key]
     
     
-    def get_classification(self, level='Sector'):
+    def peek_derived(self, key):
         """
-            level: Sector (level 1), Industry (level 2)
+            The function returns the derived structure of the key if it is built, otherwise None.
         """
         
-        df = FinancialDataAPI.__data_dict['industries']
-        level = level.title().strip()
-        return df[level].unique().tolist()
+        return self.__derived.get(key)
     
     
-    def get_all_tickers(self, as_of_date=date.today()):
+    def discard_derived(self, predicate):
         """
-            The function returns a list of tickers for a given as of date.
-            The list only contains the valid tickers.
-            i.e. the tickers must have valid price on or before the as of date.
+            The function drops the derived structures whose key matches predicate(key), they are rebuilt on the next request.
         """
         
-        num_days_check = 5 # number of days to validate if we consider the stock was active
-        
-        px_df = FinancialDataAPI.__data_dict['shareprices-daily']
-        
-        # check if price exist
-        tickers_valid = px_df[
-            (px_df['Date'] <= as_of_date.strftime(FinancialDataAPI.__date_format))
-            & (px_df['Date'] >= (as_of_date - timedelta(days=num_days_check)).strftime(FinancialDataAPI.__date_format))
-        ]['Ticker'].unique().tolist()
-        
-        return tickers_valid
+        with self.__derived_lock:
+            for key in [key for key in self.__derived if predicate(key)]:
+                del self.__derived[key]
+                self.__derived_deps.pop(key, None)
     
     
-    def get_ticker_by_classification(self, in_, level='Sector', as_of_date=date.today()):
+    def inherit(self, other, changed, data=None, derived=None):
         """
-            in_: List of sectors or industries
-            level: Sector (level 1), Industry (level 2)
-            as_of_date: datetime.date
+            The function takes over the loaded data sets and the derived structures of another registry
+            which don't depend on the changed data sets.
+            data: dictionary of data set name -> dataframe, set as loaded
+            derived: dictionary of key -> (structure, depends_on), set as built
         """
         
-        num_days_check = 5 # number of days to validate if we consider the stock was active
+        changed = set(changed)
         
-        company_df = FinancialDataAPI.__data_dict['companies']
-        industry_df = FinancialDataAPI.__data_dict['industries']
-        px_df = FinancialDataAPI.__data_dict['shareprices-daily']
+        for name in other.keys():
+            if name in self.__files and name not in changed and other.is_loaded(name):
+                self.__data[name] = other[name]
         
-        level = level.title().strip()
-        industry_ids = industry_df[industry_df[level].isin(in_)]['IndustryId'].unique().tolist()
-        
-        tickers = company_df[company_df['IndustryId'].isin(industry_ids)]['Ticker'].unique().tolist()
+        for key, value in other.__derived.items():
+            depends_on = other.__derived_deps.get(key)
+            
+            if depends_on is not None and not changed.intersection(depends_on):
+                self.__derived[key] = value
+                self.__derived_deps[key] = depends_on
         
-        # check if price exist
-        tickers_valid = px_df[
-            (px_df['Ticker'].isin(tickers)) 
-            & (px_df['Date'] <= as_of_date.strftime(FinancialDataAPI.__date_format))
-            & (px_df['Date'] >= (as_of_date - timedelta(days=num_days_check)).strftime(FinancialDataAPI.__date_format))
-        ]['Ticker'].unique().tolist()
+        self.__data.update(data or {})
         
-        return tickers_valid
+        for key, (value, depends_on) in (derived or {}).items():
+            self.__derived[key] = value
+            self.__derived_deps[key] = depends_on
+
+
+def concat_ranges(starts, counts):
+    """
+        The function concatenates the integer ranges [starts[i], starts[i] + counts[i]) into one array, without a python loop.
+    """
     
+    counts = np.asarray(counts, dtype=np.int64)
+    offsets = np.repeat(np.asarray(starts, dtype=np.int64) - np.cumsum(counts) + counts, counts)
     
-    def __get_field_info(self, keyword):
-        """
-            The function searches the field metat data given the keyword. 
-            The keyword is used to match with the long and short name in lowercase.
-            The return is a dataframe contains all metadata related to the fields matched.
-        """
+    return offsets + np.arange(counts.sum())
+
+
+class PriceStore:
+    """
+        The share prices sorted by (Ticker, Date) with the row range of each ticker.
+        The rows of a ticker for a date window are found by binary search within the row range of the ticker,
+        so the cost of a query depends on the size of the answer, not on the size of the table.
+        The tickers keep the order of their first appearance in the data set.
+    """
+    
+    def __init__(self, df):
+        codes, tickers = pd.factorize(df['Ticker'])
+        days = df['Date'].values.astype('datetime64[D]').astype(np.int64)
         
-        field_meta_df = FinancialDataAPI.__field_meta
-        search_long_name = field_meta_df['Long Name'].str.lower().str.contains(keyword.strip().lower())
-        search_short_name = field_meta_df['Short Name'].str.lower().str.contains(keyword.strip().lower())
-        match_df = field_meta_df[search_long_name | search_short_name]
-        match_df = match_df.reset_index().copy()
+        valid = (codes >= 0) & ~np.isnat(df['Date'].values)
+        keys = PriceStore.make_keys(codes, days)
         
-        del match_df['index']
+        if valid.all() and (len(keys) < 2 or (keys[1:] >= keys[:-1]).all()):
+            # the bulk file is already sorted, the columns are used without copy
+            order = None
+        else:
+            order = np.flatnonzero(valid)
+            order = order[np.argsort(keys[order], kind='stable')]
+            keys = keys[order]
         
-        return match_df
+        self.tickers = np.asarray(tickers, dtype=object)
+        self.ticker_index = pd.Index(self.tickers)
+        self.keys = keys
+        
+        self.__df = df
+        self.__order = order
+        self.__columns = {}
+        
+        self.dates = self.column('Date')
     
     
-    def display_field_info(self, keyword):
+    @staticmethod
+    def make_keys(codes, days):
         """
-            Search by field long and short names and display anyone contains the keyword.
-            keyword: str
+            The function combines the ticker codes and the dates (as days since 1970-01-01) into one sortable int64 key.
         """
         
-        match_df = self.__get_field_info(keyword)
-        
-        for i in range(len(match_df)):
-            row = match_df.iloc[i]
-            print("{long_name} ({short_name}) \n  Parameters: {params} \n  {doc} \n\n".format(
-                long_name=row['Long Name'], short_name=row['Short Name'], 
-                params=row['params'], doc=row['doc']
-            ))
-            
+        return np.asarray(codes, dtype=np.int64) * (1 << 32) + (np.asarray(days, dtype=np.int64) + (1 << 31))
     
-    def __get_field(self, field):
+    
+    def column(self, name):
         """
-            The function retunrs the field metadata as dictionary for the given field name.
-            The name can either be long or short name. Not case sensitive.
+            The function returns the values of the column in the order of the store.
         """
         
-        field_meta_df = FinancialDataAPI.__field_meta
-        search_long_name = field_meta_df['Long Name'].str.lower() == field.strip().lower()
-        search_short_name = field_meta_df['Short Name'].str.lower() == field.strip().lower()
-        match_df = field_meta_df[search_long_name | search_short_name]
+        if name not in self.__columns:
+            values = self.__df[name].values
+            self.__columns[name] = values if self.__order is None else values[self.__order]
         
-        if len(match_df) == 1:
-            return match_df.iloc[0].to_dict()
-        else:
-            raise Exception('Err: Could not find exact matching field.')
+        return self.__columns[name]
     
     
-    def __get_param_value(self, param_name, default_value=None, **kwargs):
+    def rows(self, tickers, start, end):
         """
-            The function gets the param value from the input for the given param_name -> String
-            If the param is in the input, the input value is returned
-            If the param is not in the input, the default value is returned
-            If no default value i.e. the param is a required input, the error will be raised
+            The function finds the rows of the given tickers between the start and end dates (inclusive).
+            The return is a tuple of the row positions in the store and the position of the ticker in tickers for each row.
         """
         
-        param_list = list(kwargs.keys())
-        
-        param = [p for p in param_list if p.lower().strip() == param_name.lower().strip()]
-        
-        value = default_value
+        pos = self.ticker_index.get_indexer(tickers)
+        pos = np.where(pos >= 0, pos, len(self.tickers))
         
-        if len(param):
-            # always take the first found param
-            param_name = param[0]
-            value = kwargs[param_name]
-        else:
-            if default_value == None:
-                raise Exception('Err: {}= is a required parameter'.format(param_name))
+        start_day = np.datetime64(start, 'D').astype(np.int64)
+        end_day = np.datetime64(end, 'D').astype(np.int64)
         
-        # check if the value is string and if yes, make it lower case
-        if isinstance(value, str):
-            value = value.lower()
-            
-        # check if the value is Date for Datetime and if yes, make it yyyy-mm-dd string
-        dt_format = FinancialDataAPI.__date_format
+        lo = np.searchsorted(self.keys, PriceStore.make_keys(pos, np.full(len(pos), start_day)), side='left')
+        hi = np.searchsorted(self.keys, PriceStore.make_keys(pos, np.full(len(pos), end_day)), side='right')
+        counts = np.maximum(hi - lo, 0)
         
-        if isinstance(value, date) or isinstance(value, datetime):
-            value = value.strftime(dt_format)
-            
-        return value
+        return concat_ranges(lo, counts), np.repeat(np.arange(len(pos)), counts)
     
     
-    def __get_description_data(self, tickers, field_dict, **kwargs):
+    def append(self, df, start):
         """
-            The function retrieves the description data 
-            for a given list of tickers and a field metadata as dictionary (use __get_field).
-            Only one field is allowed and field must be description data.
+            The function returns the store of df, whose rows before start are the rows of the data set of this store
+            and the rows from start are appended rows. Only the appended rows are sorted,
+            their keys are merged into the sorted keys by binary search.
+            The tickers first seen in the appended rows get the next codes, as if df was factorized in full.
         """
         
-        field_long_name = field_dict['Long Name']
-        data_set = field_dict['data_set'].split(',')
-        join_key = field_dict['join_key'].split(',')
+        tail = df['Ticker'].values[start:]
+        new_tickers = pd.unique(tail[~pd.isna(tail)])
+        new_tickers = new_tickers[self.ticker_index.get_indexer(new_tickers) < 0]
         
-        df = FinancialDataAPI.__data_dict[data_set[0]]
+        store = PriceStore.__new__(PriceStore)
+        store.tickers = np.concatenate([self.tickers, np.asarray(new_tickers, dtype=object)])
+        store.ticker_index = pd.Index(store.tickers)
         
-        if len(data_set) > 1:
-            for i in range(1, len(data_set)):
-                df = pd.merge(df, FinancialDataAPI.__data_dict[data_set[i]], how='left', on=join_key[i-1], suffixes=('', '_r'))
+        codes = store.ticker_index.get_indexer(tail)
+        dates = df['Date'].values[start:]
+        valid = (codes >= 0) & ~np.isnat(dates)
         
-        df = df[df['Ticker'].isin(tickers)][['Ticker', field_long_name]].copy()
-        df = df.set_index('Ticker')
-        df = df.loc[tickers]
+        keys = PriceStore.make_keys(codes[valid], dates[valid].astype('datetime64[D]').astype(np.int64))
+        rows = start + np.flatnonzero(valid)
         
-        return df
+        order = np.argsort(keys, kind='stable')
+        keys, rows = keys[order], rows[order]
+        pos = np.searchsorted(self.keys, keys, side='right')
+        
+        old_rows = self.__order if self.__order is not None else np.arange(len(self.keys))
+        
+        store.keys = np.insert(self.keys, pos, keys)
+        store.__df = df
+        store.__order = np.insert(old_rows, pos, rows)
+        store.__columns = {}
+        store.dates = store.column('Date')
+        
+        return store
     
     
-    def __expand_to_calendar_dates(self, df, tickers, start, end):
+    def adjustment_factor(self):
         """
-            The function works with pricing and market data fucntion.
-            It expands to the calendar date series from the original datafrme.
+            The function returns the cumulative split and dividend adjustment factor (Adj. Close / Close) of each row.
+            The adjusted price of a row is its price times its factor.
+            A row without a factor (e.g. a missing Adj. Close) takes the factor of the previous row of the same ticker,
+            or of the next one for the first rows of the ticker; NaN if the ticker has no factor at all.
         """
         
-        cols = df.columns.tolist()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            factor = self.column('Adj. Close').astype(np.float64) / self.column('Close')
         
-        num_ticker = len(tickers)
-        dates_array = pd.date_range(start=start, end=end).values
-        num_dates = len(dates_array)
+        valid = np.isfinite(factor) & (factor > 0)
         
-        ticker_index = np.sort(np.resize(tickers, num_dates * num_ticker))
-        dates_index = np.resize(dates_array, num_dates * num_ticker)
+        if valid.all():
+            return factor
         
-        expand_df = pd.DataFrame(index=[ticker_index, dates_index])
-        df = pd.concat([expand_df, df.set_index(['Ticker', 'Date'])], axis=1).reset_index()
+        n = len(factor)
+        codes = self.keys >> 32
         
-        df.columns = cols
+        prev = np.where(valid, np.arange(n), -1)
+        np.maximum.accumulate(prev, out=prev)
+        has_prev = (prev >= 0) & (codes[np.maximum(prev, 0)] == codes)
         
-        return df
+        next_ = np.where(valid, np.arange(n), n)[::-1]
+        next_ = np.minimum.accumulate(next_)[::-1]
+        has_next = (next_ < n) & (codes[np.minimum(next_, n - 1)] == codes)
+        
+        source = np.where(has_prev, prev, np.where(has_next, next_, -1))
+        
+        return np.where(source >= 0, factor[np.maximum(source, 0)], np.NaN)
     
     
-    def __get_pricing_data(self, tickers, field_dict, **kwargs):
+    def last_valid(self, tickers, before, value_of):
         """
-            The function retrieves the pricing data
-            for a given list of tickers and a field metadata as dictionary (use __get_field).
-            Only one field is allowed and field must be description data.
-            
-            Param:
-            start -> Date = required
-            end -> Date = required
-            adj -> String [y/n] = y
-            fill_prev -> String [y/n]
+            The function finds the last observation of each ticker strictly before the given date.
+            value_of maps an array of row positions to the values; a row with a NaN value is skipped
+            by scanning back in the rows of the same ticker.
+            The return is a tuple of the values and the dates of the observations (NaN and NaT if there is none).
         """
         
-        data_set = field_dict['data_set']
-        field_long_name = field_dict['Long Name']
-        
-        df = FinancialDataAPI.__data_dict[data_set]
-        
-        start = self.__get_param_value('start', **kwargs)
-        end = self.__get_param_value('end', **kwargs)
-        adj = self.__get_param_value('adj', 'y', **kwargs)
-        fill_prev = self.__get_param_value('fill_prev', 'n', **kwargs)
-        
-        start_adj = start
+        pos = self.ticker_index.get_indexer(tickers)
+        pos = np.where(pos >= 0, pos, len(self.tickers))
         
-        days_look_back = 30
+        before_day = np.datetime64(before, 'D').astype(np.int64)
         
-        if fill_prev == 'y':
-            start_adj = (datetime.strptime(start, FinancialDataAPI.__date_format) - timedelta(days=days_look_back)).strftime(FinancialDataAPI.__date_format)
-        
-        df = df[(df['Ticker'].isin(tickers)) & (df['Date'] >= start_adj) & (df['Date'] <= end)].copy()
-        
-        if adj == 'y':
-            df['Adj Factor'] = df['Adj. Close'] - df['Close']
-            df[field_long_name] = df[field_long_name] + df['Adj Factor']
-            
-        df = df[['Ticker', 'Date', field_long_name]]
+        row = np.searchsorted(self.keys, PriceStore.make_keys(pos, np.full(len(pos), before_day)), side='left') - 1
+        found = row >= 0
+        found[found] = (self.keys[row[found]] >> 32) == pos[found]
         
-        df = self.__expand_to_calendar_dates(df, tickers, start_adj, end)
+        values = np.full(len(pos), np.NaN)
+        values[found] = value_of(row[found])
         
-        if fill_prev == 'y':
-            df[field_long_name] = df.groupby('Ticker').fillna(method='ffill')[field_long_name]
+        for i in np.flatnonzero(found & np.isnan(values)):
+            # the first row of the ticker has the smallest key of its code
+            first = np.searchsorted(self.keys, pos[i] * (1 << 32), side='left')
+            prior = np.flatnonzero(~np.isnan(value_of(np.arange(first, row[i]))))
+            found[i] = len(prior) > 0
             
-        df = df[df['Date'] >= start]
+            if found[i]:
+                row[i] = first + prior[-1]
+                values[i] = value_of(row[i:i + 1])[0]
         
-        # make sure the ticker order is the same as the request
-        df['Ticker Order'] = df['Ticker'].apply(lambda x: tickers.index(x))
-        df = df.sort_values(['Ticker Order', 'Date'])
-        del df['Ticker Order']
-        df = df.set_index('Ticker')
+        dates = np.full(len(pos), np.datetime64('NaT'), dtype='datetime64[ns]')
+        dates[found] = self.dates[row[found]]
         
-        return df.copy()
-    
-    
-    def __get_market_data(self, tickers, field_dict, **kwargs):
+        return values, dates
+
+
+    def as_of(self, tickers, dates, columns):
         """
-            The function retrieves the market data
-            for a given list of tickers and a field metadata as dictionary (use __get_field).
-            Only one field is allowed and field must be description data.
-            
-            Param:
-            start -> Date = required
-            end -> Date = required
-            fill_prev -> String [y/n]
+            The function finds the last observation on or before the date of each (ticker, date) pair
+            with one binary search for all pairs. A row with a NaN value is skipped per column,
+            the last non NaN row of every row is found in one pass over the column.
+            columns: dictionary of column -> values of all rows in the order of the store
+            The return is a dictionary of column -> (values, dates of the observations), NaN and NaT if there is none.
         """
         
-        data_set = field_dict['data_set']
-        field_long_name = field_dict['Long Name']
+        pos = self.ticker_index.get_indexer(tickers)
+        pos = np.where(pos >= 0, pos, len(self.tickers))
         
-        df = FinancialDataAPI.__data_dict[data_set]
+        days = np.asarray(dates).astype('datetime64[D]').astype(np.int64)
         
-        start = self.__get_param_value('start', **kwargs)
-        end = self.__get_param_value('end', **kwargs)
-        fill_prev = self.__get_param_value('fill_prev', 'n', **kwargs)
+        row = np.searchsorted(self.keys, PriceStore.make_keys(pos, days), side='right') - 1
+        result = {}
         
-        start_adj = start
-        
-        days_look_back = 30
-        
-        if fill_prev == 'y':
-            start_adj = (datetime.strptime(start, FinancialDataAPI.__date_format) - timedelta(days=days_look_back)).strftime(FinancialDataAPI.__date_format)
+        for col, values in columns.items():
+            last = np.where(np.isnan(values), -1, np.arange(len(values)))
+            np.maximum.accumulate(last, out=last)
+            
+            found = row >= 0
+            obs = np.full(len(pos), -1, dtype=np.int64)
+            obs[found] = last[row[found]]
+            
+            found = obs >= 0
+            found[found] = (self.keys[obs[found]] >> 32) == pos[found]
+            
+            col_values = np.full(len(pos), np.NaN)
+            col_values[found] = values[obs[found]]
+            
+            col_dates = np.full(len(pos), np.datetime64('NaT'), dtype='datetime64[ns]')
+            col_dates[found] = self.dates[obs[found]]
+            
+            result[col] = (col_values, col_dates)
         
-        df = df[(df['Ticker'].isin(tickers)) & (df['Date'] >= start_adj) & (df['Date'] <= end)].copy()
+        return result
+
+
+class ActiveTickerIndex:
+    """
+        The active tickers of each date as a bitset (one row of packed bits per day, one bit per ticker of the price store).
+        A ticker is active on a date if it has a price on the date or on one of the window_days days before it.
+        The tickers are in the order of the price store.
+    """
+    
+    def __init__(self, store, window_days=5):
+        self.tickers = store.tickers
+        self.window_days = window_days
         
-        df = df[['Ticker', 'Date', field_long_name]]
+        days = store.dates.astype('datetime64[D]').astype(np.int64)
+        codes = store.keys >> 32
         
-        df = self.__expand_to_calendar_dates(df, tickers, start_adj, end)
+        self.first_day = days.min() if len(days) else 0
+        n_days = days.max() - self.first_day + window_days + 1 if len(days) else 0
         
-        if fill_prev == 'y':
-            df[field_long_name] = df.groupby('Ticker').fillna(method='ffill')[field_long_name]
-            
-        df = df[df['Date'] >= start]
+        active = np.zeros((n_days, len(self.tickers)), dtype=bool)
+        active[days - self.first_day, codes] = True
         
-        # make sure the ticker order is the same as the request
-        df['Ticker Order'] = df['Ticker'].apply(lambda x: tickers.index(x))
-        df = df.sort_values(['Ticker Order', 'Date'])
-        del df['Ticker Order']
-        df = df.set_index('Ticker')
+        traded = active.copy()
         
+        for shift in range(1, window_days + 1):
+            active[shift:] |= traded[:-shift]
         
-        return df.copy()
+        self.bits = np.packbits(active, axis=1)
     
     
-    def __fundamental_get_raw_data(self, data_set_name, tickers, field_long_name, as_of_date):
+    def extend(self, tickers, days, codes):
         """
-            The function gets the raw fundamental data for the given ticker, field and as of date
+            The function returns the index with new prices added, without going through the prices already indexed.
+            tickers: the tickers of the price store with the new prices (the existing tickers keep their codes)
+            days: the dates of the new prices as days since 1970-01-01
+            codes: the ticker codes of the new prices
         """
         
-        df = FinancialDataAPI.__data_dict[data_set_name]
+        index = ActiveTickerIndex.__new__(ActiveTickerIndex)
+        index.tickers = tickers
+        index.window_days = self.window_days
         
-        # free version of the bulk data from SimFin doesn't provide full restated history
-        # if use the paid version, then use 'Restated Date' otherwise use 'Publish Date'
-        df = df[(df['Ticker'].isin(tickers)) & (df['Publish Date'] <= as_of_date)].copy()
+        first_day, n_days = self.first_day, len(self.bits)
         
-        df['As of Date'] = as_of_date
-        df['As of Date'] = df['As of Date'].astype('datetime64')
+        if len(days):
+            first_day = min(first_day, days.min()) if n_days else days.min()
+            last_day = max(self.first_day + n_days - 1, days.max() + self.window_days) if n_days else days.max() + self.window_days
+            n_days = last_day - first_day + 1
         
-        cols = df.columns.tolist()
-        fixed_cols = cols[:cols.index('Restated Date') + 1] + ['As of Date']
-        raw_data_cols = [c for c in fixed_cols + [field_long_name] if c != 'SimFinId']
+        active = np.zeros((n_days, len(tickers)), dtype=bool)
+        offset = self.first_day - first_day
+        active[offset:offset + len(self.bits), :len(self.tickers)] = np.unpackbits(self.bits, axis=1, count=len(self.tickers)).astype(bool)
         
-        df = df[raw_data_cols].sort_values(['Ticker', 'Publish Date'])
-        df = df.groupby(['Ticker', 'Report Date']).tail(1).sort_values(['Ticker', 'Report Date'])
+        for shift in range(self.window_days + 1):
+            active[days - first_day + shift, codes] = True
         
-        return df.copy()
+        index.first_day = first_day
+        index.bits = np.packbits(active, axis=1)
+        
+        return index
     
     
-    def __fundamental_fill_missing_tickers(self, df, tickers, as_of_date):
+    def membership(self, dates):
         """
-            The function check if all tickers in the df index, if no means no data and will fill the ticker with NaN
+            The function returns a boolean matrix (date x ticker) of the active tickers on the given dates.
         """
         
-        if 'Ticker' in df.columns.tolist():
-            df = df.set_index('Ticker')
+        pos = np.asarray(dates, dtype='datetime64[D]').astype(np.int64) - self.first_day
+        in_range = (pos >= 0) & (pos < len(self.bits))
         
-        missing_tickers = [tk for tk in tickers if tk not in df.index.tolist()]
-        if len(missing_tickers):
-            for tk in missing_tickers:
-                df.loc[tk] = np.NaN
-                df.loc[tk, 'As of Date'] = pd.to_datetime(as_of_date, format=FinancialDataAPI.__date_format)
-            
-        return df.reset_index()
+        bits = np.zeros((len(pos), self.bits.shape[1]), dtype=np.uint8)
+        bits[in_range] = self.bits[pos[in_range]]
+        
+        return np.unpackbits(bits, axis=1, count=len(self.tickers)).astype(bool)
     
     
-    def __fundamental_offset_period(self, data_set_name, tickers, field_long_name, offset_start, offset_end, as_of_date):
+    def active(self, as_of_date):
         """
-            The function gets the fundamental data for the given offset periods
+            The function returns the positions of the active tickers on the date.
         """
         
-        df = self.__fundamental_get_raw_data(data_set_name, tickers, field_long_name, as_of_date)
+        return np.flatnonzero(self.membership([as_of_date])[0])
+
+
+class FundamentalStore:
+    """
+        The reports of a statement sorted by (Ticker, Publish Date), with the versions of each report.
+        The rows of a ticker known on an as of date are a prefix of its rows, found by binary search.
+        A row is the live version of its report in a prefix if it is in the prefix and the next publication
+        of the same report (Ticker, Report Date) is not, so the reports known on a date are gathered
+        in report date order from the precomputed (Ticker, Report Date) order without sorting.
+    """
+    
+    def __init__(self, df):
+        codes, tickers = pd.factorize(df['Ticker'])
+        publish = df['Publish Date'].values.astype('datetime64[D]').astype(np.int64)
+        report = df['Report Date'].values.astype('datetime64[D]').astype(np.int64)
         
-        if offset_start == offset_end:
-            offset_func = lambda d: d.sort_values(['Ticker', 'Report Date']).iloc[offset_end-1]
-        else:
-            if offset_end < 0:
-                offset_func = lambda d: d.sort_values(['Ticker', 'Report Date']).iloc[offset_start-1:offset_end+1]
-            else:
-                offset_func = lambda d: d.sort_values(['Ticker', 'Report Date']).iloc[offset_start-1:]
+        rows = np.flatnonzero((codes >= 0) & ~np.isnat(df['Publish Date'].values))
+        rows = rows[np.lexsort((publish[rows], codes[rows]))]
+        codes, publish, report = codes[rows], publish[rows], report[rows]
         
-        df = df.groupby('Ticker').apply(offset_func)
+        self.tickers = np.asarray(tickers, dtype=object)
+        self.ticker_index = pd.Index(self.tickers)
+        self.rows = rows
+        self.keys = PriceStore.make_keys(codes, publish)
         
-        # add missing tickers
-        df = self.__fundamental_fill_missing_tickers(df, tickers, as_of_date)
+        # the row range of each ticker, the last entries are the empty ranges of the unknown tickers
+        self.ticker_start = np.searchsorted(codes, np.arange(len(self.tickers) + 2))
         
-        # make sure the ticker order is the same as the request
-        df['Ticker Order'] = df['Ticker'].apply(lambda x: tickers.index(x))
-        df = df.sort_values(['Ticker Order', 'As of Date', 'Report Date'])
-        del df['Ticker Order']
-        df = df.set_index('Ticker')
+        # the positions of the rows sorted by (Ticker, Report Date, Publish Date)
+        num_rows = len(rows)
+        self.by_report = np.lexsort((np.arange(num_rows), report, codes))
         
-        return df.copy()
+        # the position of the next publication of the same report, num_rows for the latest
+        self.next_version = np.full(num_rows, num_rows)
+        
+        prev, next_ = self.by_report[:-1], self.by_report[1:]
+        same = (codes[prev] == codes[next_]) & (report[prev] == report[next_])
+        self.next_version[prev[same]] = next_[same]
     
     
-    def __fundamental_offset_period_aod_range(self, data_set_name, tickers, field_long_name, offset_start, offset_end, as_of_date_start, as_of_date_end):
+    def known_reports(self, tickers, as_of_dates):
         """
-            The function gets the offset period data for a given as of date range.
+            The function finds the reports known on each as of date for each ticker, the latest publication of each report.
+            The queries are ordered by ticker, then by as of date. The queries knowing the same rows share one state.
+            The return is a tuple of the state of each query, the number of states, and the state
+            and the row in the data set of each report, sorted by state and then by report date.
         """
-        df = FinancialDataAPI.__data_dict[data_set_name]
         
-        # free version of the bulk data from SimFin doesn't provide full restated history
-        # if use the paid version, then use 'Restated Date' otherwise use 'Report Date'
-        dt_range = df[
-            (df['Ticker'].isin(tickers)) & 
-            (df['Publish Date'] >= as_of_date_start) & 
-            (df['Publish Date'] <= as_of_date_end)
-        ]['Publish Date'].unique()
+        pos = self.ticker_index.get_indexer(tickers)
+        pos = np.where(pos >= 0, pos, len(self.tickers))
         
-        dt_range = [pd.to_datetime(dt).strftime(FinancialDataAPI.__date_format) for dt in dt_range]
+        days = np.asarray(as_of_dates).astype('datetime64[D]').astype(np.int64)
         
-        # make sure we have enough data
-        if len(dt_range):
+        q_codes = np.repeat(pos, len(days))
+        known_end = np.searchsorted(self.keys, PriceStore.make_keys(q_codes, np.tile(days, len(pos))), side='right')
         
-            if as_of_date_start != dt_range[0]:
-                dt_range = [as_of_date_start] + dt_range
-
-            full_dt_range = [pd.to_datetime(dt).strftime(FinancialDataAPI.__date_format) for dt in pd.date_range(start=as_of_date_start, end=as_of_date_end)]
+        states, q_state = np.unique(q_codes.astype(np.int64) * (len(self.keys) + 1) + known_end, return_inverse=True)
+        state_codes = states // (len(self.keys) + 1)
+        state_end = states % (len(self.keys) + 1)
+        
+        start = self.ticker_start[state_codes]
+        counts = np.where(state_end > start, self.ticker_start[state_codes + 1] - start, 0)
+        
+        state_id = np.repeat(np.arange(len(states)), counts)
+        positions = self.by_report[concat_ranges(start, counts)]
+        
+        end = state_end[state_id]
+        live = (positions < end) & (self.next_version[positions] >= end)
+        
+        return q_state, len(states), state_id[live], self.rows[positions[live]]
 
-            df_list = []
-            last_df = None
 
-            for dt in full_dt_range:
-                if dt in dt_range:
-                    last_df = self.__fundamental_offset_period(data_set_name, tickers, field_long_name, offset_start, offset_end, dt)
-                    df_list.append(last_df.copy())
-                else:
-                    last_df['As of Date'] = dt
-                    df_list.append(last_df.copy())
+class Panel:
+    """
+        A dense (date x ticker) panel of one field, see get_data(..., layout='panel').
+        values[i, j] is the value of tickers[j] on dates[i], the missing values are NaN.
+    """
+    
+    def __init__(self, dates, tickers, values):
+        self.dates = dates
+        self.tickers = tickers
+        self.values = values
+    
+    
+    @property
+    def nbytes(self):
+        return self.dates.nbytes + self.tickers.nbytes + self.values.nbytes
+    
+    
+    def to_frame(self):
+        """
+            The function returns the panel as dataframe with the dates as index and the tickers as columns.
+        """
+        
+        return pd.DataFrame(self.values, index=pd.DatetimeIndex(self.dates, name='Date'), columns=pd.Index(self.tickers, name='Ticker'))
 
-            df = pd.concat(df_list, sort=False).reset_index()
-            df['As of Date'] = pd.to_datetime(df['As of Date'], format=FinancialDataAPI.__date_format)
 
-            # make sure the ticker order is the same as the request
-            df['Ticker Order'] = df['Ticker'].apply(lambda x: tickers.index(x))
-            df = df.sort_values(['Ticker Order', 'As of Date', 'Publish Date'])
-            del df['Ticker Order']
-            df = df.set_index('Ticker')
-            
-            return df.copy()
-        else:
-            # todo return for all tickers NA
-            raise Exception('Err: No enough data.')
-        
+class ResultCache:
+    """
+        A memoization cache with a byte budget and least recently used eviction.
+        The values are copied when they are stored and when they are returned,
+        so a caller can't change a cached result.
+    """
     
-    def __fundamental_absolute_period_q_ttm(self, data_set_name, tickers, field_long_name, y_start, q_start, y_end, q_end, as_of_date):
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        
+        self.__items = OrderedDict()
+        self.__bytes = 0
+        self.__lock = threading.Lock()
+    
+    
+    @staticmethod
+    def size_of(value):
         """
-            The function gets the quarterly and last 12 months fundamental data for the given absolute periods
+            The function estimates the number of bytes used by the value.
         """
-            
-        df = self.__fundamental_get_raw_data(data_set_name, tickers, field_long_name, as_of_date)
-        
-        df['Quarter'] = df['Fiscal Period'].str[-1:].astype(int)
-        
-        df = df[
-            (df['Fiscal Year'] >= y_start) & (df['Fiscal Year'] <= y_end)
-            & (df['Quarter'] >= q_start) & (df['Quarter'] <= q_end)
-        ]
-        
-        cols = [c for c in df.columns.tolist() if c != 'Quarter']
-        df = df[cols]
         
-        # add missing tickers
-        df = self.__fundamental_fill_missing_tickers(df, tickers, as_of_date)
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            return int(value.memory_usage(index=True, deep=True).sum())
+        elif isinstance(value, Panel):
+            return value.nbytes
+        elif isinstance(value, dict):
+            return sys.getsizeof(value) + sum(ResultCache.size_of(v) for v in value.values())
+        elif isinstance(value, (list, tuple)):
+            return sys.getsizeof(value) + sum(sys.getsizeof(v) for v in value)
+        else:
+            return sys.getsizeof(value)
+    
+    
+    @staticmethod
+    def copy_of(value):
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            return value.copy(deep=True)
+        else:
+            return copy.deepcopy(value)
+    
+    
+    def get(self, key):
+        """
+            The function returns a tuple of (found, copy of the value) for the key.
+        """
         
-        # make sure the ticker order is the same as the request
-        df = df.reset_index()
-        df['Ticker Order'] = df['Ticker'].apply(lambda x: tickers.index(x))
-        df = df.sort_values(['Ticker Order', 'As of Date', 'Publish Date'])
-        del df['Ticker Order']
-        df = df.set_index('Ticker')
-        del df['index']
+        with self.__lock:
+            if key not in self.__items:
+                self.misses += 1
+                return False, None
+            
+            self.__items.move_to_end(key)
+            self.hits += 1
+            value = self.__items[key][0]
         
-        return df.copy()
+        return True, ResultCache.copy_of(value)
     
     
-    def __fundamental_absolute_period_a(self, data_set_name, tickers, field_long_name, y_start, y_end, as_of_date):
+    def put(self, key, value):
         """
-            The function gets the annually fundamental data for the given absolute periods
+            The function stores a copy of the value and evicts the least recently used values above the byte budget.
+            A value larger than the whole budget is not stored.
         """
         
-        df = self.__fundamental_get_raw_data(data_set_name, tickers, field_long_name, as_of_date)
-        
-        df = df[
-            (df['Fiscal Year'] >= y_start) & (df['Fiscal Year'] <= y_end)
-        ]
+        size = ResultCache.size_of(value)
         
-        # add missing tickers
-        df = self.__fundamental_fill_missing_tickers(df, tickers, as_of_date)
+        if size > self.max_bytes:
+            return
         
-        # make sure the ticker order is the same as the request
-        df = df.reset_index()
-        df['Ticker Order'] = df['Ticker'].apply(lambda x: tickers.index(x))
-        df = df.sort_values(['Ticker Order', 'As of Date', 'Publish Date'])
-        del df['Ticker Order']
-        df = df.set_index('Ticker')
-        del df['index']
+        value = ResultCache.copy_of(value)
         
-        return df.copy()
-    
-    
-    def __get_fundamental_data(self, tickers, field_dict, **kwargs):
-        """
-            The function retrieves the fundamental data
-            for a given list of tickers and a field metadata as dictionary (use __get_field).
-            Only one field is allowed and field must be description data.
+        with self.__lock:
+            if key in self.__items:
+                self.__bytes -= self.__items.pop(key)[1]
             
-            Param:
-            Period Type: pt -> String [q/a/ttm] = ttm
+            self.__items[key] = (value, size)
+            self.__bytes += size
+            
+            while self.__bytes > self.max_bytes:
+                _, (_, evicted_size) = self.__items.popitem(last=False)
+                self.__bytes -= evicted_size
+                self.evictions += 1
+    
+    
+    def clear(self):
+        with self.__lock:
+            self.__items.clear()
+            self.__bytes = 0
+    
+    
+    def stats(self):
+        with self.__lock:
+            return {
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': len(self.__items), 'bytes': self.__bytes, 'max_bytes': self.max_bytes,
+            }
+
+
+class ProfileStage:
+    """
+        A timed stage of a profiled call, see Profiler. A call is a stage with info (e.g. the number of tickers).
+        rows can be set to the number of rows the stage produced.
+    """
+    
+    def __init__(self, profiler, name, info=None):
+        self.profiler = profiler
+        self.name = name
+        self.info = info
+        self.rows = None
+        self.stages = []
+        self.depth = 0
+        self.start = None
+        self.seconds = None
+    
+    
+    def annotate(self, **info):
+        if self.info is not None:
+            self.info.update(info)
+    
+    
+    def __enter__(self):
+        self.profiler.enter(self)
+        self.start = time.perf_counter()
+        
+        return self
+    
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.seconds = time.perf_counter() - self.start
+        self.profiler.exit(self, exc_type is not None)
+        
+        return False
+
+
+class NullStage:
+    """
+        The stage used when the profiling is off, it records nothing.
+    """
+    
+    def annotate(self, **info):
+        pass
+    
+    
+    def __setattr__(self, name, value):
+        pass
+    
+    
+    def __enter__(self):
+        return self
+    
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+class Profiler:
+    """
+        The stage timers of the API calls. A call (e.g. get_data) is traced with the named stages run inside it,
+        their seconds and row counts. When the outermost call of a thread ends, its trace record is passed
+        to the callbacks and the last keep records are kept.
+        The count, seconds and rows of every call and stage are aggregated by name.
+    """
+    
+    def __init__(self, keep=1000):
+        self.callbacks = []
+        self.records = deque(maxlen=keep)
+        
+        self.__stats = {}
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+    
+    
+    @staticmethod
+    def count_rows(value):
+        """
+            The function returns the number of rows of a result: the length of a dataframe or list,
+            dates x tickers for a Panel, summed over a dictionary of Panels.
+        """
+        
+        if isinstance(value, Panel):
+            return value.values.size
+        elif isinstance(value, dict):
+            return sum(Profiler.count_rows(v) for v in value.values())
+        elif hasattr(value, '__len__'):
+            return len(value)
+        
+        return None
+    
+    
+    def call(self, name, **info):
+        return ProfileStage(self, name, info)
+    
+    
+    def stage(self, name):
+        return ProfileStage(self, name)
+    
+    
+    def current(self):
+        """
+            The function returns the outermost call traced in this thread, None if there is none.
+        """
+        
+        stack = getattr(self.__local, 'stack', None)
+        
+        return stack[0] if stack else None
+    
+    
+    def enter(self, stage):
+        if not hasattr(self.__local, 'stack'):
+            self.__local.stack = []
+        
+        stage.depth = len(self.__local.stack)
+        self.__local.stack.append(stage)
+    
+    
+    def exit(self, stage, failed):
+        stack = self.__local.stack
+        stack.pop()
+        
+        with self.__lock:
+            stat = self.__stats.get(stage.name)
+            
+            if stat is None:
+                stat = self.__stats[stage.name] = {
+                    'kind': 'call' if stage.info is not None else 'stage',
+                    'count': 0, 'errors': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'rows': 0,
+                }
+            
+            stat['count'] += 1
+            stat['errors'] += int(failed)
+            stat['seconds'] += stage.seconds
+            stat['max_seconds'] = max(stat['max_seconds'], stage.seconds)
+            stat['rows'] += stage.rows or 0
+        
+        if stack:
+            # the stages (and nested calls) are recorded in the trace of the outermost call
+            stack[0].stages.append({
+                'stage': stage.name, 'depth': stage.depth, 'offset': stage.start - stack[0].start,
+                'seconds': stage.seconds, 'rows': stage.rows,
+            })
+        elif stage.info is not None:
+            record = {'call': stage.name, 'seconds': stage.seconds, 'rows': stage.rows, 'error': failed}
+            record.update(stage.info)
+            record['stages'] = sorted(stage.stages, key=lambda s: s['offset'])
+            
+            self.records.append(record)
+            
+            for callback in list(self.callbacks):
+                callback(record)
+    
+    
+    def stats(self, reset=False):
+        with self.__lock:
+            stats = {name: dict(stat) for name, stat in self.__stats.items()}
+            
+            if reset:
+                self.__stats.clear()
+        
+        return stats
+
+
+@dataclass(frozen=True)
+class FieldSpec:
+    """
+        The metadata of one field (one row of fields-meta.csv), compiled when the meta is loaded.
+        data_sets: the data sets used by the field; the data_set column separates the data sets joined together by ','
+        and the period types by '/'.
+        params: the names of the parameters of the field.
+        expression: the FieldExpression of a derived field (see derived-fields-meta.csv), None for the other fields
+        bases: the fields (not derived) a derived field reads, directly or through other derived fields
+    """
+    
+    long_name: str
+    short_name: str
+    data_set: str
+    join_key: str
+    func: str
+    doc: str
+    data_sets: tuple
+    params: tuple
+    expression: object = None
+    bases: tuple = ()
+    
+    
+    @property
+    def category(self):
+        return self.func[4:]
+
+
+class FieldExpression:
+    """
+        The compiled expression of a derived field, e.g. [Volume] * [Close|adj=n].
+        A field is referenced by its long or short name in brackets. The parameters after '|' (name=value, separated by ',')
+        override the ones of the request for this reference. The expression may use numbers, + - * / **, parentheses
+        and the functions abs(x), log(x), shift(x, n) and pct_change(x, n); shift and pct_change look n rows (1 by default)
+        back in the rows of the same ticker in the result, e.g. the previous date of the pricing data.
+        The expression is compiled into nested tuples, which are also the keys of the values computed for a request:
+        ('num', value), ('ref', long name, overrides), ('neg', x), ('bin', operator, x, y), ('call', function, x, n)
+        The overrides are tuples of (param name, value) sorted by name.
+        lagged: True if the values look back with shift or pct_change, directly or through a referenced derived field
+    """
+    
+    __ref_pattern = re.compile(r'\[([^\[\]]+)\]')
+    
+    __operators = {ast.Add: 'add', ast.Sub: 'subtract', ast.Mult: 'multiply', ast.Div: 'true_divide', ast.Pow: 'power'}
+    
+    __functions = {'abs': False, 'log': False, 'shift': True, 'pct_change': True} # function -> takes n
+    
+    def __init__(self, text, resolve):
+        """
+            text: the expression
+            resolve: function which returns the FieldSpec of a referenced field name, it raises if there is none
+        """
+        
+        self.text = text
+        self.fields = {}
+        refs = []
+        
+        def replace(match):
+            name, _, overrides = match.group(1).partition('|')
+            field_spec = resolve(name.strip())
+            
+            self.fields[field_spec.long_name] = field_spec
+            refs.append(('ref', field_spec.long_name, self.__parse_overrides(field_spec, overrides)))
+            
+            return ' _ref{} '.format(len(refs) - 1)
+        
+        source = FieldExpression.__ref_pattern.sub(replace, text).strip()
+        
+        try:
+            tree = ast.parse(source, mode='eval')
+        except SyntaxError:
+            raise Exception('Err: Invalid expression {}.'.format(text))
+        
+        if not len(refs):
+            raise Exception('Err: The expression {} references no field.'.format(text))
+        
+        self.root = self.__compile(tree.body, refs)
+        self.lagged = self.__is_lagged(self.root) or any(spec.expression.lagged for spec in self.fields.values() if spec.expression is not None)
+    
+    
+    def __parse_overrides(self, field_spec, overrides):
+        """
+            The function parses the overridden parameters of a reference, e.g. 'adj=n, fill_prev=y'.
+            The names are lower case, the integer values are int and the other values lower case strings.
+        """
+        
+        parsed = {}
+        
+        for item in overrides.split(','):
+            if not item.strip():
+                continue
+            
+            name, sep, value = item.partition('=')
+            name, value = name.strip().lower(), value.strip().lower()
+            
+            if not sep or name not in field_spec.params:
+                raise Exception('Err: {} is not a parameter of {} in the expression {}.'.format(item.strip(), field_spec.long_name, self.text))
+            
+            parsed[name] = int(value) if re.fullmatch(r'-?\d+', value) else value
+        
+        return tuple(sorted(parsed.items()))
+    
+    
+    def __compile(self, node, refs):
+        """
+            The function converts the python syntax tree of the expression into nested tuples, see FieldExpression.
+        """
+        
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+            return ('num', float(node.value))
+        
+        if isinstance(node, ast.Name) and re.fullmatch(r'_ref\d+', node.id):
+            return refs[int(node.id[4:])]
+        
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            operand = self.__compile(node.operand, refs)
+            return ('neg', operand) if isinstance(node.op, ast.USub) else operand
+        
+        if isinstance(node, ast.BinOp) and type(node.op) in FieldExpression.__operators:
+            return ('bin', FieldExpression.__operators[type(node.op)], self.__compile(node.left, refs), self.__compile(node.right, refs))
+        
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FieldExpression.__functions and not node.keywords:
+            takes_n = FieldExpression.__functions[node.func.id]
+            args = node.args
+            
+            if len(args) == 1 or (takes_n and len(args) == 2 and isinstance(args[1], ast.Constant) and type(args[1].value) is int):
+                return ('call', node.func.id, self.__compile(args[0], refs), args[1].value if len(args) == 2 else (1 if takes_n else None))
+        
+        # the error shows the references as written
+        part = re.sub(r'_ref(\d+)', lambda match: '[{}]'.format(refs[int(match.group(1))][1]), ast.unparse(node))
+        
+        raise Exception('Err: {} is not supported in the expression {}.'.format(part, self.text))
+    
+    
+    def __is_lagged(self, node):
+        """
+            The function checks if the compiled node calls shift or pct_change.
+        """
+        
+        if node[0] == 'call':
+            return node[1] in ('shift', 'pct_change') or self.__is_lagged(node[2])
+        
+        if node[0] == 'neg':
+            return self.__is_lagged(node[1])
+        
+        if node[0] == 'bin':
+            return self.__is_lagged(node[2]) or self.__is_lagged(node[3])
+        
+        return False
+    
+    
+    def references(self, overrides=()):
+        """
+            The function returns the referenced fields as list of (long name, overrides), where the overrides
+            of the reference are merged into the given ones (the ones of the reference win).
+        """
+        
+        found = []
+        stack = [self.root]
+        
+        while stack:
+            node = stack.pop()
+            
+            if node[0] == 'ref':
+                found.append((node[1], FieldExpression.merge(overrides, node[2])))
+            elif node[0] in ('neg', 'call'):
+                stack.append(node[2] if node[0] == 'call' else node[1])
+            elif node[0] == 'bin':
+                stack.extend([node[2], node[3]])
+        
+        return found
+    
+    
+    @staticmethod
+    def merge(overrides, ref_overrides):
+        return tuple(sorted(dict(overrides, **dict(ref_overrides)).items())) if ref_overrides else overrides
+    
+    
+    def evaluate(self, value_of, shift, memo, overrides=()):
+        """
+            The function evaluates the expression on the arrays of the referenced fields.
+            value_of(long name, overrides): the values of a referenced field
+            shift(values, n): the values n rows back in the rows of the same ticker
+            memo: dictionary of (node, overrides) -> values, shared by the fields of a request, so
+            the sub-expressions several fields have in common are computed once
+        """
+        
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            return self.__evaluate(self.root, overrides, value_of, shift, memo)
+    
+    
+    def __evaluate(self, node, overrides, value_of, shift, memo):
+        key = (node, overrides)
+        
+        if key in memo:
+            return memo[key]
+        
+        kind = node[0]
+        
+        if kind == 'num':
+            value = node[1]
+        elif kind == 'ref':
+            value = value_of(node[1], FieldExpression.merge(overrides, node[2]))
+        elif kind == 'neg':
+            value = np.negative(self.__evaluate(node[1], overrides, value_of, shift, memo))
+        elif kind == 'bin':
+            left = self.__evaluate(node[2], overrides, value_of, shift, memo)
+            right = self.__evaluate(node[3], overrides, value_of, shift, memo)
+            value = getattr(np, node[1])(left, right)
+        else:
+            values = self.__evaluate(node[2], overrides, value_of, shift, memo)
+            
+            if node[1] == 'abs':
+                value = np.abs(values)
+            elif node[1] == 'log':
+                value = np.log(values)
+            elif node[1] == 'shift':
+                value = shift(values, node[3])
+            else:
+                value = values / shift(values, node[3]) - 1
+        
+        memo[key] = value
+        
+        return value
+
+
+class FieldIndex:
+    """
+        The field metadata compiled into FieldSpec objects,
+        with a case insensitive dictionary of long and short name -> field.
+        The derived fields (func get_derived_data) are compiled after the fields they reference.
+    """
+    
+    def __init__(self, meta_df):
+        rows = meta_df.to_dict('records')
+        
+        self.specs = [
+            FieldSpec(
+                long_name=row['Long Name'], short_name=row['Short Name'], data_set=row['data_set'],
+                join_key=row['join_key'], func=row['func'], doc=row['doc'],
+                data_sets=tuple(d.strip() for d in row['data_set'].replace('/', ',').split(',') if d.strip()),
+                params=tuple(p.strip().lower() for p in row['params'].split(',') if p.strip()),
+            )
+            for row in rows if row['func'] != 'get_derived_data'
+        ]
+        
+        self.__names = {}
+        
+        for spec in self.specs:
+            for name in {spec.long_name.lower(), spec.short_name.lower()}:
+                self.__names.setdefault(name, []).append(spec)
+        
+        derived_rows = [row for row in rows if row['func'] == 'get_derived_data']
+        
+        for row in derived_rows:
+            for name in {row['Long Name'].lower(), row['Short Name'].lower()}:
+                if name in self.__names:
+                    raise Exception('Err: The name of the derived field {} is already used.'.format(row['Long Name']))
+                
+                self.__names[name] = [row]
+        
+        for row in derived_rows:
+            self.__build_derived(row, [])
+        
+        self.__long_names = meta_df['Long Name'].str.lower()
+        self.__short_names = meta_df['Short Name'].str.lower()
+    
+    
+    def get(self, name):
+        """
+            The function returns the field with the long or short name, None if there is no or more than one match.
+        """
+        
+        specs = self.__names.get(name.strip().lower(), [])
+        
+        return specs[0] if len(specs) == 1 else None
+    
+    
+    def __build_derived(self, row, building):
+        """
+            The function compiles the derived field of the meta row, and first the derived fields it references.
+            The names of the derived fields not compiled yet map to their rows.
+            building: the derived fields being compiled, to find the references in a cycle
+        """
+        
+        name = row['Long Name']
+        compiled = self.__names[name.lower()][0]
+        
+        if isinstance(compiled, FieldSpec):
+            return compiled
+        
+        if name in building:
+            raise Exception('Err: The derived field {} references itself.'.format(name))
+        
+        def resolve(ref_name):
+            specs = self.__names.get(ref_name.lower(), [])
+            
+            if len(specs) != 1:
+                raise Exception('Err: Could not find the field {} of the derived field {}.'.format(ref_name, name))
+            
+            spec = specs[0]
+            
+            if isinstance(spec, dict):
+                spec = self.__build_derived(spec, building + [name])
+            
+            if spec.func == 'get_description_data':
+                raise Exception('Err: The derived field {} can only reference numeric fields.'.format(name))
+            
+            return spec
+        
+        expression = FieldExpression(row['expression'], resolve)
+        
+        bases = {}
+        
+        for spec in expression.fields.values():
+            for base in spec.bases or (spec,):
+                bases.setdefault(base.long_name, base)
+        
+        bases = tuple(bases.values())
+        
+        spec = FieldSpec(
+            long_name=name, short_name=row['Short Name'], data_set='', join_key='', func='get_derived_data', doc=row['doc'],
+            data_sets=tuple(dict.fromkeys(d for base in bases for d in base.data_sets)),
+            params=tuple(dict.fromkeys(p for base in bases for p in base.params)),
+            expression=expression, bases=bases,
+        )
+        
+        self.specs.append(spec)
+        
+        for key in {name.lower(), row['Short Name'].lower()}:
+            self.__names[key] = [spec]
+        
+        return spec
+    
+    
+    def search(self, keyword):
+        """
+            The function returns a boolean mask of the fields whose long or short name contains the keyword.
+        """
+        
+        keyword = keyword.strip().lower()
+        
+        return self.__long_names.str.contains(keyword) | self.__short_names.str.contains(keyword)
+
+
+def refresh_on_change(query):
+    """
+        The decorator of the queries of FinancialDataAPI reading the data sets. If a data set not read yet
+        has changed on the drive since the load (e.g. by the daily update of the csv files), the query refreshes
+        the data sets (see FinancialDataAPI.refresh_data_sets) and runs once more on the new snapshot,
+        so it reads all its data from the updated files.
+    """
+    
+    @functools.wraps(query)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return query(self, *args, **kwargs)
+        except DataSetChangedError:
+            self.refresh_data_sets()
+            return query(self, *args, **kwargs)
+    
+    return wrapper
+
+
+@dataclass(frozen=True)
+class DataSnapshot:
+    """
+        One version of the loaded data: the raw data sets (with their derived structures) and the fields metadata.
+        A snapshot is never changed once published. A reload publishes a new snapshot (read-copy-update),
+        the queries running keep the snapshot they started with, so they never see half of a reload.
+        The data sets of a snapshot not read yet are read from the files as they were when it was published
+        (see DataSetRegistry). A query reading a file rewritten since refreshes the data sets
+        and runs again on the new snapshot (see refresh_on_change).
+        generation: 1 for the first snapshot, incremented by each reload
+    """
+    
+    data_dict: DataSetRegistry
+    field_meta: pd.DataFrame
+    field_index: FieldIndex
+    generation: int
+
+
+class FinancialDataAPI:
+    __current = None
+    __local = threading.local()
+    __write_lock = threading.RLock()
+    __result_cache = None
+    __adjusted_price_cache = False
+    __profiler = None
+    __null_stage = NullStage()
+    __string_pool = {}
+    __shared_path = None
+    __shared_state = None
+    __load_report = {}
+    __load_params = None
+    __file_states = {}
+    __fingerprint_bytes = 1 << 20
+    __csv_engine = 'pyarrow' if importlib.util.find_spec('pyarrow') is not None else 'c'
+    __date_format = '%Y-%m-%d'
+    __meta_dir = './meta'
+    __meta_files = ['fields-meta.csv', 'derived-fields-meta.csv']
+    __cache_dir = '.cache'
+    __cache_version = 1
+    
+    def __init__(self, source='./data', sep=';', use_cache=True, compact=False, float32=False, shared=None):
+        """
+            source: folder of the bulk csv files
+            sep: separator of the csv files
+            use_cache: if True, the data sets are read from the columnar cache under source/.cache
+            compact: if True, the data sets are loaded in the memory optimized layout (see __compact_data_set)
+            float32: if True, the price and volume columns are loaded as float32 (compact mode only)
+            shared: folder of a shared store (see publish_shared), the data sets are attached from it instead of source
+        """
+        
+        if shared is not None and FinancialDataAPI.__shared_path != shared:
+            # attach the data sets and meta published by the loader process
+            self.__attach_shared(shared)
+        
+        if FinancialDataAPI.__current is None:
+            with FinancialDataAPI.__write_lock:
+                if FinancialDataAPI.__current is None:
+                    # load fields metadata and all raw data sets
+                    field_meta, field_index = self.__read_field_meta(FinancialDataAPI.__meta_dir)
+                    
+                    self.__publish(self.__load_data_sets(source, sep, use_cache, compact, float32, field_index), field_meta, field_index)
+    
+    
+    def reload_data_sets_and_meta(self, source='./data', sep=';', use_cache=True, compact=False, float32=False):
+        """
+            The function reloads the raw data sets and data meta from the drive.
+            The columnar cache is only rebuilt for the csv files which have changed.
+            If the data sets are attached from a shared store, the latest published generation is attached instead.
+            The queries running during the reload finish on the former data (see DataSnapshot).
+        """
+        
+        with FinancialDataAPI.__write_lock:
+            if FinancialDataAPI.__shared_path is not None:
+                self.__attach_shared(FinancialDataAPI.__shared_path)
+                return
+            
+            FinancialDataAPI.__string_pool = {}
+            FinancialDataAPI.__load_report = {}
+            FinancialDataAPI.__file_states = {}
+            
+            # load fields metadata and all raw data sets
+            field_meta, field_index = self.__read_field_meta(FinancialDataAPI.__meta_dir)
+            
+            self.__publish(self.__load_data_sets(source, sep, use_cache, compact, float32, field_index), field_meta, field_index)
+    
+    
+    def refresh_data_sets(self):
+        """
+            The function refreshes the raw data sets after the csv files are updated, e.g. by the daily SimFin update,
+            without reading the unchanged files again:
+            - a file with the same size and modification time is kept as it is, with the structures built from it
+            - a file which only has rows appended (the start and the former end of the file are unchanged)
+              is updated by reading the new rows only; they are merged into the loaded data set,
+              its price store and the active ticker index
+            - any other changed file is read again in full on its next use
+            The return is a dictionary of data set name -> unchanged, appended, reloaded, added or removed.
+            The data sets not read yet are not listed, they are read from the updated files on their first use.
+            A query reading a changed file before the refresh calls it itself (see refresh_on_change).
+            The queries running during the refresh finish on the former data (see DataSnapshot).
+        """
+        
+        if FinancialDataAPI.__shared_path is not None:
+            self.__sync_shared()
+            return {}
+        
+        with FinancialDataAPI.__write_lock:
+            source, sep, use_cache, compact, float32 = FinancialDataAPI.__load_params
+            snapshot = FinancialDataAPI.__current
+            old_dict = snapshot.data_dict
+            new_dict = self.__load_data_sets(source, sep, use_cache, compact, float32, snapshot.field_index)
+            
+            status = {name: 'removed' for name in old_dict.keys() if name not in new_dict}
+            data, derived = {}, {}
+            unread_changed = False
+            
+            for name in new_dict.keys():
+                if name not in old_dict:
+                    status[name] = 'added'
+                    continue
+                
+                if not old_dict.is_loaded(name) or name not in FinancialDataAPI.__file_states:
+                    # the former snapshot can't read the updated file (see DataSetRegistry), the new one will
+                    unread_changed = unread_changed or old_dict.signature_of(name) != new_dict.signature_of(name)
+                    continue
+                
+                path = new_dict.path_of(name)
+                state = FinancialDataAPI.__file_states[name]
+                stat = os.stat(path)
+                
+                if stat.st_size == state['size'] and stat.st_mtime_ns == state['mtime_ns']:
+                    status[name] = 'unchanged'
+                elif self.__is_appended(path, state):
+                    status[name] = 'appended'
+                    
+                    # the new state is recorded before the read, only the rows up to its size are read
+                    data[name] = self.__load_data_set(name, path, lambda path: (self.__append_data_set(
+                        name, path, old_dict[name], state['size'], FinancialDataAPI.__file_states[name]['size'], sep, use_cache, compact, float32
+                    ), 'append'))
+                    derived.update(self.__append_derived(old_dict, name, data[name], len(old_dict[name])))
+                else:
+                    status[name] = 'reloaded'
+            
+            new_dict.inherit(old_dict, [name for name, s in status.items() if s != 'unchanged'], data, derived)
+            
+            if unread_changed or any(s != 'unchanged' for s in status.values()):
+                self.__publish(new_dict, snapshot.field_meta, snapshot.field_index)
+        
+        return status
+    
+    
+    def __file_state(self, path, size=None):
+        """
+            The function returns the state of a csv file used to find the changes by refresh_data_sets:
+            the size, the modification time and the hashes of the first and the last block of the file.
+            If size is given, the state is taken of the first size bytes of the file.
+        """
+        
+        stat = os.stat(path)
+        size = stat.st_size if size is None else size
+        block = FinancialDataAPI.__fingerprint_bytes
+        
+        with open(path, 'rb') as f:
+            head = f.read(min(size, block))
+            f.seek(max(size - block, 0))
+            tail = f.read(size - max(size - block, 0))
+        
+        return {
+            'size': size, 'mtime_ns': stat.st_mtime_ns,
+            'head': hashlib.sha1(head).hexdigest(), 'tail': hashlib.sha1(tail).hexdigest(),
+            'ends_with_newline': tail[-1:] == b'\n',
+        }
+    
+    
+    def __is_appended(self, path, state):
+        """
+            The function checks if rows were only appended to the csv file since its state (see __file_state) was taken:
+            the file is larger and its first and former last block are unchanged.
+        """
+        
+        if os.path.getsize(path) <= state['size'] or not state['ends_with_newline']:
+            return False
+        
+        prefix_state = self.__file_state(path, state['size'])
+        
+        return prefix_state['head'] == state['head'] and prefix_state['tail'] == state['tail']
+    
+    
+    def __append_data_set(self, data_set, path, df, start, end, sep, use_cache, compact, float32):
+        """
+            The function reads the rows appended to the csv file between the start and end offsets (bytes)
+            and returns the data set with the rows appended. The columnar cache is updated as well.
+        """
+        
+        with open(path, 'rb') as f:
+            header = f.readline()
+            f.seek(start)
+            tail_df = self.__read_csv(io.BytesIO(header + f.read(end - start)), sep)
+        
+        if compact:
+            tail_df = self.__compact_data_set(data_set, tail_df, float32, FinancialDataAPI.__current.field_index)
+        
+        if list(tail_df.columns) != list(df.columns):
+            raise Exception('Err: The columns of the appended rows of {} do not match.'.format(data_set))
+        
+        df = pd.concat([df, tail_df], ignore_index=True)
+        
+        if use_cache and not compact:
+            cache_path = os.path.join(os.path.dirname(path), FinancialDataAPI.__cache_dir, os.path.basename(path))
+            
+            try:
+                self.__write_columnar(df, cache_path, self.__source_signature(path, sep))
+            except OSError:
+                # the data folder is read only, the cache is rebuilt from the csv file on the next start
+                pass
+        
+        return df
+    
+    
+    def __append_derived(self, old_dict, data_set, df, start):
+        """
+            The function updates the price store and the active ticker index built from the old data set
+            with the rows of df from start. The return is a dictionary of key -> (structure, depends_on), see DataSetRegistry.inherit.
+        """
+        
+        derived = {}
+        store = old_dict.peek_derived(('price_store', data_set))
+        
+        if store is None:
+            return derived
+        
+        new_store = store.append(df, start)
+        derived[('price_store', data_set)] = (new_store, (data_set,))
+        
+        index = old_dict.peek_derived('active_tickers')
+        
+        if data_set == 'shareprices-daily' and index is not None:
+            codes = new_store.ticker_index.get_indexer(df['Ticker'].values[start:])
+            dates = df['Date'].values[start:]
+            valid = (codes >= 0) & ~np.isnat(dates)
+            days = dates[valid].astype('datetime64[D]').astype(np.int64)
+            
+            derived['active_tickers'] = (index.extend(new_store.tickers, days, codes[valid]), (data_set,))
+        
+        return derived
+    
+    
+    def publish_shared(self, path, source='./data', sep=';', keep=2):
+        """
+            The function publishes the raw data sets of the source folder and the field meta into a shared store,
+            so the processes on the same machine (e.g. the workers of a web server or a backtest pool)
+            attach them with FinancialDataAPI(shared=path) instead of each reading the csv files.
+            Each call writes a new generation (a folder of columnar data sets, see __write_columnar)
+            and then points the CURRENT file to it. The attached processes switch to the new generation
+            on their next request. The generations older than the last keep ones are deleted.
+            The return is the number of the new generation.
+        """
+        
+        os.makedirs(path, exist_ok=True)
+        
+        generations = [int(d[4:]) for d in os.listdir(path) if d.startswith('gen-') and d[4:].isdigit()]
+        generation = max(generations, default=-1) + 1
+        gen_path = os.path.join(path, 'gen-{}'.format(generation))
+        
+        files = [f for f in os.listdir(source) if f[0] != '.' and os.path.isfile(os.path.join(source, f))]
+        
+        for f in files:
+            file_path = os.path.join(source, f)
+            df, _ = self.__read_data_set(file_path, sep, True)
+            
+            if not self.__write_columnar(df, os.path.join(gen_path, self.__data_set_name(f)), self.__source_signature(file_path, sep)):
+                raise Exception('Err: The data set {} can not be stored in the columnar format.'.format(f))
+        
+        for meta_file in FinancialDataAPI.__meta_files:
+            if os.path.isfile(os.path.join(FinancialDataAPI.__meta_dir, meta_file)):
+                shutil.copyfile(os.path.join(FinancialDataAPI.__meta_dir, meta_file), os.path.join(gen_path, meta_file))
+        
+        # the CURRENT file is replaced in one step, a reader sees either the old or the new generation
+        tmp_path = os.path.join(path, 'CURRENT.tmp-{}'.format(os.getpid()))
+        
+        with open(tmp_path, 'w') as f:
+            f.write(str(generation))
+        
+        os.replace(tmp_path, os.path.join(path, 'CURRENT'))
+        
+        for old in generations:
+            if old <= generation - keep:
+                # the memory maps of the attached processes stay valid after the files are deleted
+                shutil.rmtree(os.path.join(path, 'gen-{}'.format(old)), ignore_errors=True)
+        
+        return generation
+    
+    
+    def __attach_shared(self, path):
+        """
+            The function attaches the current generation of the shared store (see publish_shared).
+            The numeric and date columns are memory mapped from the store, so all the attached processes share them.
+        """
+        
+        current_path = os.path.join(path, 'CURRENT')
+        stat = os.stat(current_path)
+        
+        with open(current_path) as f:
+            gen_path = os.path.join(path, 'gen-{}'.format(f.read().strip()))
+        
+        files = {d: os.path.join(gen_path, d) for d in os.listdir(gen_path) if os.path.isdir(os.path.join(gen_path, d))}
+        field_meta, field_index = self.__read_field_meta(gen_path)
+        
+        with FinancialDataAPI.__write_lock:
+            FinancialDataAPI.__string_pool = {}
+            FinancialDataAPI.__load_report = {}
+            FinancialDataAPI.__shared_path = path
+            FinancialDataAPI.__shared_state = (stat.st_ino, stat.st_mtime_ns)
+            
+            self.__publish(
+                DataSetRegistry(files, lambda path: self.__load_data_set(os.path.basename(path), path, self.__read_shared_data_set)),
+                field_meta, field_index
+            )
+    
+    
+    def __read_field_meta(self, meta_dir):
+        """
+            The function reads the fields metadata of the meta folder: fields-meta.csv and, if present,
+            the derived fields of derived-fields-meta.csv (Long Name, Short Name, expression, doc; see FieldExpression).
+            The derived fields get the category derived_data, and the data sets and params of the fields they read.
+            The return is a tuple of the metadata dataframe and its FieldIndex.
+        """
+        
+        field_meta = pd.read_csv(os.path.join(meta_dir, 'fields-meta.csv')).fillna('')
+        derived_path = os.path.join(meta_dir, 'derived-fields-meta.csv')
+        
+        if not os.path.isfile(derived_path):
+            return field_meta, FieldIndex(field_meta)
+        
+        derived_meta = pd.read_csv(derived_path).fillna('').assign(data_set='', join_key='', params='', func='get_derived_data')
+        field_meta = pd.concat([field_meta.assign(expression=''), derived_meta[list(field_meta.columns) + ['expression']]], ignore_index=True)
+        field_index = FieldIndex(field_meta)
+        
+        derived_specs = {spec.long_name: spec for spec in field_index.specs if spec.expression is not None}
+        is_derived = field_meta['func'] == 'get_derived_data'
+        
+        field_meta.loc[is_derived, 'data_set'] = [','.join(derived_specs[name].data_sets) for name in field_meta.loc[is_derived, 'Long Name']]
+        field_meta.loc[is_derived, 'params'] = [', '.join(derived_specs[name].params) for name in field_meta.loc[is_derived, 'Long Name']]
+        
+        return field_meta, field_index
+    
+    
+    def __publish(self, data_dict, field_meta, field_index):
+        """
+            The function publishes the data sets and the fields metadata as the new snapshot (see DataSnapshot).
+            The snapshot is swapped in one assignment: the queries starting afterwards use it,
+            the queries running keep the former one. The cached results of the former snapshot are dropped.
+            The caller holds the write lock, so the reloads are published one at a time.
+        """
+        
+        current = FinancialDataAPI.__current
+        generation = current.generation + 1 if current is not None else 1
+        
+        FinancialDataAPI.__current = DataSnapshot(data_dict, field_meta, field_index, generation)
+        
+        # the cached results may come from the old data
+        if FinancialDataAPI.__result_cache is not None:
+            FinancialDataAPI.__result_cache.clear()
+    
+    
+    def __snapshot(self):
+        """
+            The function returns the snapshot the current query is pinned to (see __pin), otherwise the latest snapshot.
+        """
+        
+        snapshot = getattr(FinancialDataAPI.__local, 'snapshot', None)
+        
+        return snapshot if snapshot is not None else FinancialDataAPI.__current
+    
+    
+    @contextlib.contextmanager
+    def __pin(self, snapshot=None):
+        """
+            The function pins the latest snapshot (or the given one) to the current thread for the duration of a query,
+            so all the data sets, derived structures and fields metadata read by the query come from the same reload.
+            A nested pin keeps the snapshot of the outer one.
+        """
+        
+        local = FinancialDataAPI.__local
+        
+        if getattr(local, 'snapshot', None) is not None:
+            yield local.snapshot
+            return
+        
+        local.snapshot = snapshot if snapshot is not None else FinancialDataAPI.__current
+        
+        try:
+            yield local.snapshot
+        finally:
+            local.snapshot = None
+    
+    
+    def get_data_generation(self):
+        """
+            The function returns the generation of the loaded data: 1 after the first load, incremented by each reload
+            or refresh which changed the data (or attach of a new generation of the shared store).
+            Two results with the same generation were computed from the same data.
+        """
+        
+        self.__sync_shared()
+        
+        return FinancialDataAPI.__current.generation
+    
+    
+    def get_request_key(self, name, *args, **kwargs):
+        """
+            The function returns the key of the result of the query name(*args, **kwargs), e.g. get_data, on the loaded data:
+            a tuple of the data generation and the normalized request (the unique tickers, the long names of the fields,
+            the params and the dates), the same as the key of the result cache.
+            Two queries with the same key return the same result (see AsyncFinancialDataAPI).
+        """
+        
+        self.__sync_shared()
+        
+        arguments = inspect.signature(getattr(self, name)).bind(*args, **kwargs)
+        arguments.apply_defaults()
+        arguments = arguments.arguments
+        
+        with self.__pin() as snapshot:
+            if name == 'get_data' or name == 'get_snapshots':
+                tickers, field_specs = self.__get_request(arguments['tickers'], arguments['field'])
+                params = self.__normalize_params(arguments['kwargs'])
+                
+                if name == 'get_data':
+                    # the panel of a single field is unwrapped (see __unwrap_panel)
+                    key = self.__get_data_key(tickers, field_specs, params) + (isinstance(arguments['field'], (list, tuple)),)
+                else:
+                    key = self.__get_snapshots_key(tickers, field_specs, self.__get_snapshot_dates(arguments['dates']), params)
+            elif name == 'get_all_tickers':
+                key = ('get_all_tickers', arguments['as_of_date'].strftime(FinancialDataAPI.__date_format))
+            elif name == 'get_universe_history':
+                key = ('get_universe_history', tuple(pd.to_datetime(pd.Series(arguments['dates'])).values.astype('datetime64[D]').astype(str)))
+            elif name == 'get_ticker_by_classification':
+                key = (
+                    'get_ticker_by_classification', tuple(arguments['in_']), arguments['level'].title().strip(),
+                    arguments['as_of_date'].strftime(FinancialDataAPI.__date_format)
+                )
+            elif name == 'get_classification':
+                key = ('get_classification', arguments['level'].title().strip())
+            else:
+                raise Exception('Err: {} is not a query.'.format(name))
+        
+        return (snapshot.generation, key)
+    
+    
+    def __read_shared_data_set(self, path):
+        """
+            The function reads one data set of the shared store.
+            The return is a tuple of the dataframe and the source ('shared').
+        """
+        
+        df = self.__read_columnar(path, None)
+        
+        if df is None:
+            raise Exception('Err: Could not read the shared data set {}.'.format(path))
+        
+        return df, 'shared'
+    
+    
+    def __sync_shared(self):
+        """
+            The function attaches the new generation of the shared store if the loader process has published one.
+            It is called at the start of each request and costs one stat of the CURRENT file.
+        """
+        
+        path = FinancialDataAPI.__shared_path
+        
+        if path is None:
+            return
+        
+        stat = os.stat(os.path.join(path, 'CURRENT'))
+        
+        if (stat.st_ino, stat.st_mtime_ns) != FinancialDataAPI.__shared_state:
+            with FinancialDataAPI.__write_lock:
+                # another thread may have attached it in the meantime
+                if (stat.st_ino, stat.st_mtime_ns) != FinancialDataAPI.__shared_state:
+                    self.__attach_shared(path)
+    
+    
+    def enable_result_cache(self, max_bytes=256 * 1024 ** 2):
+        """
+            The function turns on the memoization of get_data, get_all_tickers and get_ticker_by_classification.
+            The results are kept up to max_bytes, the least recently used results are evicted first.
+            The cache is shared by all instances and cleared by reload_data_sets_and_meta.
+        """
+        
+        if FinancialDataAPI.__result_cache is None:
+            FinancialDataAPI.__result_cache = ResultCache(max_bytes)
+        else:
+            FinancialDataAPI.__result_cache.max_bytes = max_bytes
+    
+    
+    def disable_result_cache(self):
+        """
+            The function turns off the memoization and drops the cached results.
+        """
+        
+        FinancialDataAPI.__result_cache = None
+    
+    
+    def enable_adjusted_price_cache(self):
+        """
+            The function turns on the cache of the adjusted prices: an adjusted pricing field is computed
+            for all rows of the data set the first time it is requested and then only looked up,
+            at the cost of one column of memory per field. The columns are rebuilt when the data set is reloaded.
+        """
+        
+        FinancialDataAPI.__adjusted_price_cache = True
+    
+    
+    def disable_adjusted_price_cache(self):
+        """
+            The function turns off the cache of the adjusted prices and drops the cached columns,
+            the adjusted prices are then computed for the requested rows only.
+        """
+        
+        FinancialDataAPI.__adjusted_price_cache = False
+        
+        if FinancialDataAPI.__current is not None:
+            FinancialDataAPI.__current.data_dict.discard_derived(lambda key: isinstance(key, tuple) and key[0] == 'adjusted_price')
+    
+    
+    def get_result_cache_stats(self):
+        """
+            The function returns the hits, misses, evictions, number of entries and bytes of the result cache as dictionary.
+            None is returned if the cache is not enabled.
+        """
+        
+        cache = FinancialDataAPI.__result_cache
+        
+        return cache.stats() if cache is not None else None
+    
+    
+    def __cached(self, key_func, func):
+        """
+            The function returns func() through the result cache when it is enabled.
+            key_func is only called when the cache is enabled and must return a hashable key.
+        """
+        
+        cache = FinancialDataAPI.__result_cache
+        
+        if cache is None:
+            return func()
+        
+        # the generation keeps a result of the former data, put after a reload, from being found
+        key = (self.__snapshot().generation, key_func())
+        found, value = cache.get(key)
+        
+        if FinancialDataAPI.__profiler is not None:
+            call = FinancialDataAPI.__profiler.current()
+            
+            if call is not None:
+                call.annotate(cache='hit' if found else 'miss')
+        
+        if not found:
+            value = func()
+            cache.put(key, value)
+        
+        return value
+    
+    
+    def enable_profiling(self, callback=None, keep=1000):
+        """
+            The function turns on the stage timers of the API calls.
+            Each call of get_data, get_snapshots, iter_data (per chunk) and the ticker lists is traced with its stages
+            (e.g. price.rows, price.panels, fundamental.point_in_time), their seconds and row counts.
+            The trace record of a call is a dictionary passed to callback(record) and the last keep records are kept.
+            The profiler is shared by all instances, see get_profile_stats for the aggregated stats.
+        """
+        
+        if FinancialDataAPI.__profiler is None:
+            FinancialDataAPI.__profiler = Profiler(keep)
+        
+        if callback is not None:
+            FinancialDataAPI.__profiler.callbacks.append(callback)
+        
+        return FinancialDataAPI.__profiler
+    
+    
+    def disable_profiling(self):
+        """
+            The function turns off the stage timers and drops the records and the stats.
+        """
+        
+        FinancialDataAPI.__profiler = None
+    
+    
+    def get_profile_stats(self, reset=False):
+        """
+            The function returns the aggregated stats of the profiling as dictionary of call or stage name ->
+            dictionary of kind (call/stage), count, errors, seconds (total), max_seconds and rows (total).
+            With reset=True, the stats start again from zero. None is returned if the profiling is not enabled.
+        """
+        
+        profiler = FinancialDataAPI.__profiler
+        
+        return profiler.stats(reset) if profiler is not None else None
+    
+    
+    def get_profile_records(self):
+        """
+            The function returns the last trace records of the profiling as list, None if the profiling is not enabled.
+        """
+        
+        profiler = FinancialDataAPI.__profiler
+        
+        return list(profiler.records) if profiler is not None else None
+    
+    
+    @contextlib.contextmanager
+    def profile(self, callback=None):
+        """
+            The function profiles the calls made in a with block and yields the list of their trace records:
+            
+            with api.profile() as records:
+                api.get_data(...)
+            
+            If the profiling was off, it is turned off again at the end of the block.
+        """
+        
+        enabled = FinancialDataAPI.__profiler is not None
+        profiler = self.enable_profiling()
+        
+        records = []
+        callbacks = [records.append] + ([callback] if callback is not None else [])
+        profiler.callbacks.extend(callbacks)
+        
+        try:
+            yield records
+        finally:
+            for cb in callbacks:
+                profiler.callbacks.remove(cb)
+            
+            if not enabled:
+                self.disable_profiling()
+    
+    
+    def __trace(self, name, **info):
+        """
+            The function returns the profiled call of the name, it does nothing if the profiling is off.
+        """
+        
+        profiler = FinancialDataAPI.__profiler
+        
+        return profiler.call(name, **info) if profiler is not None else FinancialDataAPI.__null_stage
+    
+    
+    def __stage(self, name):
+        """
+            The function returns the timed stage of the name, it does nothing if the profiling is off.
+        """
+        
+        profiler = FinancialDataAPI.__profiler
+        
+        return profiler.stage(name) if profiler is not None else FinancialDataAPI.__null_stage
+    
+    
+    def __get_data_key(self, tickers, field_specs, params):
+        """
+            The function returns the key of a get_data request normalized by __get_request and __normalize_params.
+        """
+        
+        return ('get_data', tuple(tickers), tuple(fs.long_name for fs in field_specs), self.__get_params_key(field_specs, params))
+    
+    
+    def __get_snapshots_key(self, tickers, field_specs, dates, params):
+        """
+            The function returns the key of a get_snapshots request, the dates are normalized by __get_snapshot_dates.
+        """
+        
+        return ('get_snapshots', tuple(tickers), tuple(fs.long_name for fs in field_specs), tuple(dates.tolist()), self.__get_params_key(field_specs, params))
+    
+    
+    def __get_snapshot_dates(self, dates):
+        """
+            The function returns the unique sorted dates of a get_snapshots request as datetime64[ns] array.
+        """
+        
+        return np.unique(pd.to_datetime(list(dates)).values.astype('datetime64[D]')).astype('datetime64[ns]')
+    
+    
+    def __get_params_key(self, field_specs, params):
+        """
+            The function returns the parameters normalized by __normalize_params as a hashable key.
+        """
+        
+        key = []
+        
+        for param_name, value in params.items():
+            if isinstance(value, (list, tuple, np.ndarray, pd.Index)):
+                value = tuple(str(v) for v in value)
+            
+            key.append((param_name, value))
+        
+        # the default as of date of the fundamental data is today
+        if any(field_spec.func == 'get_fundamental_data' for field_spec in self.__base_specs(field_specs)):
+            key.append(('today', date.today().strftime(FinancialDataAPI.__date_format)))
+        
+        return tuple(sorted(key))
+    
+    
+    def __load_data_sets(self, source, sep, use_cache, compact, float32, field_index):
+        """
+            The function registers all raw data sets in the source folder.
+            The key is the file name without the 'us-' prefix and the '.csv' suffix.
+            The data sets are not read here, each one is read the first time it is used.
+            field_index: the fields metadata the data sets are compacted with (see __compact_data_set)
+        """
+        
+        files = [f for f in os.listdir(source) if f[0] != '.' and os.path.isfile(os.path.join(source, f))]
+        files = {self.__data_set_name(f): os.path.join(source, f) for f in files}
+        names = {path: name for name, path in files.items()}
+        
+        FinancialDataAPI.__load_params = (source, sep, use_cache, compact, float32)
+        
+        def read(path):
+            df, origin = self.__read_data_set(path, sep, use_cache)
+            return (self.__compact_data_set(names[path], df, float32, field_index) if compact else df), origin
+        
+        return DataSetRegistry(files, lambda path: self.__load_data_set(names[path], path, read), lambda path: self.__source_signature(path, sep))
+    
+    
+    def __data_set_name(self, file_name):
+        """
+            The function returns the data set name of the csv file: the file name without the 'us-' prefix and the '.csv' suffix.
+        """
+        
+        return file_name.replace('.csv', '').replace('us-', '')
+    
+    
+    def __load_data_set(self, data_set, path, read):
+        """
+            The function loads one data set with read(path), which returns a tuple of the dataframe and its source,
+            and records the time, rows and bytes of the load in the load report (see get_load_report).
+        """
+        
+        started = time.perf_counter()
+        
+        if os.path.isfile(path):
+            # the state is taken before the read, a change during the read is found by the next refresh
+            FinancialDataAPI.__file_states[data_set] = self.__file_state(path)
+        
+        df, origin = read(path)
+        
+        FinancialDataAPI.__load_report[data_set] = {
+            'Source': origin,
+            'Seconds': time.perf_counter() - started,
+            'Rows': len(df),
+            'Columns': len(df.columns),
+            'File Bytes': os.path.getsize(path) if os.path.isfile(path) else None,
+            'Memory Bytes': int(df.memory_usage(index=False).sum()),
+        }
+        
+        return df
+    
+    
+    def get_load_report(self):
+        """
+            The function returns a dataframe with one row per loaded data set:
+            where it was read from (csv, cache or shared), the seconds it took, the rows, the columns,
+            the bytes of the csv file and the bytes of the columns in memory (without the text values).
+        """
+        
+        report = pd.DataFrame.from_dict(FinancialDataAPI.__load_report, orient='index',
+                                        columns=['Source', 'Seconds', 'Rows', 'Columns', 'File Bytes', 'Memory Bytes'])
+        report.index.name = 'Data Set'
+        
+        return report
+    
+    
+    def __read_data_set(self, path, sep, use_cache):
+        """
+            The function reads one raw data set.
+            If use_cache is True, the data set is read from the columnar cache under source/.cache
+            and the cache is (re)built from the csv file when it is missing or out of date.
+            The return is a tuple of the dataframe and the source ('csv' or 'cache').
+        """
+        
+        if not use_cache:
+            return self.__read_csv(path, sep), 'csv'
+        
+        cache_path = os.path.join(os.path.dirname(path), FinancialDataAPI.__cache_dir, os.path.basename(path))
+        signature = self.__source_signature(path, sep)
+        
+        df = self.__read_columnar(cache_path, signature)
+        
+        if df is not None:
+            return df, 'cache'
+        
+        df = self.__read_csv(path, sep)
+        
+        try:
+            self.__write_columnar(df, cache_path, signature)
+        except OSError:
+            # the data folder is read only, keep working from the csv file
+            pass
+        
+        return df, 'csv'
+    
+    
+    def __read_csv(self, path, sep):
+        """
+            The function reads one raw data set from the csv file.
+            The date columns are parsed into the datetime64 type during the read.
+            The pyarrow engine is used if it is installed.
+        """
+        
+        date_cols = [col for col in pd.read_csv(path, sep=sep, nrows=0).columns if 'date' in col.lower()]
+        
+        if hasattr(path, 'seek'):
+            # a buffer is read again from the start
+            path.seek(0)
+        
+        try:
+            df = pd.read_csv(path, sep=sep, parse_dates=date_cols, engine=FinancialDataAPI.__csv_engine)
+        except (ValueError, ImportError):
+            # the options are not supported by the engine
+            if hasattr(path, 'seek'):
+                path.seek(0)
+            
+            df = pd.read_csv(path, sep=sep, parse_dates=date_cols)
+        
+        for col in date_cols:
+            if df[col].dtype != 'datetime64[ns]':
+                # a value could not be parsed, the conversion raises the error
+                df[col] = df[col].astype('datetime64[ns]')
+        
+        return df
+    
+    
+    def __source_signature(self, path, sep):
+        """
+            The function returns the signature of the csv file used to check if the cache is up to date.
+        """
+        
+        stat = os.stat(path)
+        
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sep': sep, 'version': FinancialDataAPI.__cache_version}
+    
+    
+    def __read_columnar(self, cache_path, signature):
+        """
+            The function reads a data set from the columnar cache.
+            Numeric and date columns are memory mapped, so processes on the same machine share the pages.
+            Text columns are stored as category codes and decoded back to strings.
+            None is returned if the cache is missing or does not match the signature (not checked if signature is None).
+        """
+        
+        meta_path = os.path.join(cache_path, 'meta.json')
+        
+        if not os.path.isfile(meta_path):
+            return None
+        
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            
+            if signature is not None and meta['signature'] != signature:
+                return None
+            
+            # an empty file can't be memory mapped
+            mmap_mode = 'r' if meta['rows'] else None
+            
+            data = {}
+            for i, col in enumerate(meta['columns']):
+                values = np.load(os.path.join(cache_path, '{}.npy'.format(i)), mmap_mode=mmap_mode)
+                
+                if col['kind'] == 'category':
+                    categories = np.load(os.path.join(cache_path, '{}.categories.npy'.format(i))).astype(object)
+                    codes = np.asarray(values)
+                    values = categories.take(codes) if len(categories) else np.full(len(codes), np.NaN, dtype=object)
+                    values[codes < 0] = np.NaN
+                
+                data[col['name']] = values
+        except (OSError, ValueError, KeyError):
+            return None
+        
+        return pd.DataFrame(data, columns=[col['name'] for col in meta['columns']], copy=False)
+    
+    
+    def __write_columnar(self, df, cache_path, signature):
+        """
+            The function writes a data set into the columnar cache, one .npy file per column.
+            The files are written into a temporary folder first and then moved in place,
+            so a reader never sees a half written cache.
+            The return is False if the data set can't be stored in the columnar format.
+        """
+        
+        columns = []
+        for col in df.columns:
+            if df[col].dtype == object:
+                if not df[col].dropna().map(lambda x: isinstance(x, str)).all():
+                    # mixed types can't be stored as category codes, keep the csv only
+                    return False
+                columns.append({'name': col, 'kind': 'category'})
+            elif 'date' in col.lower():
+                columns.append({'name': col, 'kind': 'date'})
+            else:
+                columns.append({'name': col, 'kind': 'numeric'})
+        
+        tmp_path = '{}.tmp-{}'.format(cache_path, os.getpid())
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        
+        try:
+            for i, col in enumerate(columns):
+                series = df[col['name']]
+                
+                if col['kind'] == 'category':
+                    codes, categories = pd.factorize(series)
+                    np.save(os.path.join(tmp_path, '{}.categories.npy'.format(i)), np.asarray(categories, dtype=str))
+                    np.save(os.path.join(tmp_path, '{}.npy'.format(i)), codes.astype(np.int32))
+                else:
+                    np.save(os.path.join(tmp_path, '{}.npy'.format(i)), series.to_numpy())
+            
+            # the meta file is written last, it marks the cache as complete
+            with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+                json.dump({'signature': signature, 'rows': len(df), 'columns': columns}, f)
+            
+            shutil.rmtree(cache_path, ignore_errors=True)
+            os.rename(tmp_path, cache_path)
+        finally:
+            # another process may have written the same cache in the meantime
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        
+        return True
+    
+    
+    def __compact_data_set(self, data_set, df, float32, field_index):
+        """
+            The function converts a data set into the memory optimized layout:
+            - the columns no field reads are dropped (the fixed columns of the statements up to Restated Date,
+              the date columns, the join keys and the columns used by the price adjustment are kept)
+            - the text columns, e.g. Ticker, are interned in one string pool shared by all data sets
+            - the integer columns are downcast to the smallest integer type holding the values
+            - if float32 is True, the float columns of the pricing and market data sets are made float32
+        """
+        
+        field_specs = [fs for fs in field_index.specs if data_set in fs.data_sets]
+        
+        if len(field_specs):
+            cols = list(df.columns)
+            keep = {'Ticker'}
+            keep.update(cols[:cols.index('Restated Date') + 1] if 'Restated Date' in cols else [])
+            keep.update(c for c in cols if 'date' in c.lower())
+            
+            for field_spec in field_specs:
+                keep.add(field_spec.long_name)
+                keep.update(k.strip() for k in field_spec.join_key.split(',') if k.strip())
+                
+                if field_spec.func == 'get_pricing_data':
+                    keep.update(['Adj. Close', 'Close'])
+            
+            df = df[[c for c in cols if c in keep]]
+        
+        is_price = any(fs.func in ('get_pricing_data', 'get_market_data') for fs in field_specs)
+        pool = FinancialDataAPI.__string_pool
+        data = {}
+        
+        for col in df.columns:
+            values = df[col].values
+            
+            if values.dtype == object:
+                codes, uniques = pd.factorize(values)
+                uniques = np.array([pool.setdefault(u, u) if isinstance(u, str) else u for u in uniques] + [np.NaN], dtype=object)
+                values = uniques.take(codes)
+            elif values.dtype.kind in 'iu':
+                values = pd.to_numeric(values, downcast='integer' if values.dtype.kind == 'i' else 'unsigned')
+            elif values.dtype.kind == 'f' and float32 and is_price:
+                values = values.astype(np.float32)
+            
+            data[col] = values
+        
+        return pd.DataFrame(data, columns=list(df.columns))
+    
+    
+    def memory_report(self):
+        """
+            The function returns the memory used by the loaded data sets as dataframe,
+            one row per data set and column with the dtype and the bytes.
+            The bytes of a text column include each distinct text once, as the equal texts share one string object.
+            The data sets not read yet are not listed, use preload to read them first.
+        """
+        
+        data_dict = self.__snapshot().data_dict
+        rows = []
+        
+        for data_set in [d for d in data_dict.keys() if data_dict.is_loaded(d)]:
+            df = data_dict[data_set]
+            
+            for col in df.columns:
+                values = df[col].values
+                size = values.nbytes
+                
+                if values.dtype == object:
+                    size += sum(sys.getsizeof(v) for v in pd.unique(values))
+                
+                rows.append({'Data Set': data_set, 'Column': col, 'dtype': str(values.dtype), 'Bytes': size})
+        
+        return pd.DataFrame(rows, columns=['Data Set', 'Column', 'dtype', 'Bytes']).set_index(['Data Set', 'Column'])
+    
+    
+    def list_fields(self):
+        """
+            The function shows the full list of fields
+        """
+        
+        df = self.__snapshot().field_meta[['Long Name', 'Short Name', 'func', 'doc']].copy()
+        df['func'] = df['func'].str[4:]
+        df = df.rename(columns={'func': 'Category', 'doc': 'Quick Document'})
+        
+        return df.copy()
+    
+    
+    def list_data_category(self):
+        """
+            The function lists all the data categories available
+        """
+        
+        return [cat.replace('get_', '') for cat in self.__snapshot().field_meta['func'].unique().tolist()]
+        
+    
+    def list_fields_by_category(self, category_list):
+        """
+            The function returns a list of fields for a given category list
+            category_list: list of categories
+        """
+        
+        category_list = [f'get_{cat}' for cat in category_list]
+        field_meta = self.__snapshot().field_meta
+        df = field_meta[field_meta['func'].isin(category_list)]
+        df = df[['Long Name', 'Short Name', 'func', 'doc']]
+        df['func'] = df['func'].str[4:]
+        df = df.rename(columns={'func': 'Category', 'doc': 'Quick Document'})
+        
+        return df.copy()
+    
+    
+    def list_data_sets(self, loaded_only=False):
+        """
+            The function retuns a list of names of the raw data sets.
+            loaded_only: if True, only the data sets already read from the drive are returned
+        """
+        
+        data_dict = self.__snapshot().data_dict
+        
+        return [d for d in data_dict.keys() if not loaded_only or data_dict.is_loaded(d)]
+    
+    
+    @refresh_on_change
+    def get_data_set(self, data_set):
+        """
+            The function returns raw data set for a given name of the data set.
+            The data set is read from the drive on the first request.
+        """
+        
+        self.__sync_shared()
+        
+        return self.__snapshot().data_dict[data_set]
+    
+    
+    @refresh_on_change
+    def preload(self, data_sets=None, fields=None, workers=None):
+        """
+            The function reads the given data sets in advance, so the first get_data call doesn't pay for it.
+            data_sets: list of data set names, see list_data_sets()
+            fields: list of field names (long or short name), the data sets used by the fields are read
+            workers: number of data sets read at the same time, the number of cpus by default
+            If both data_sets and fields are None, all data sets are read.
+            The time, rows and bytes of each read are recorded in the load report, see get_load_report.
+        """
+        
+        with self.__pin() as snapshot:
+            if data_sets is None and fields is None:
+                data_sets = self.list_data_sets()
+            
+            names = list(data_sets or [])
+            
+            for field in fields or []:
+                names += list(self.__get_field(field).data_sets)
+            
+            workers = workers if workers is not None else (os.cpu_count() or 1)
+            
+            snapshot.data_dict.preload(list(dict.fromkeys(names)), workers)
+    
+    
+    @refresh_on_change
+    def get_classification(self, level='Sector'):
+        """
+            level: Sector (level 1), Industry (level 2)
+        """
+        
+        self.__sync_shared()
+        
+        df = self.__snapshot().data_dict['industries']
+        level = level.title().strip()
+        return df[level].unique().tolist()
+    
+    
+    @refresh_on_change
+    def get_all_tickers(self, as_of_date=date.today()):
+        """
+            The function returns a list of tickers for a given as of date.
+            The list only contains the valid tickers.
+            i.e. the tickers must have valid price on or before the as of date.
+        """
+        
+        self.__sync_shared()
+        
+        with self.__pin(), self.__trace('get_all_tickers') as call:
+            result = self.__cached(
+                lambda: ('get_all_tickers', as_of_date.strftime(FinancialDataAPI.__date_format)),
+                lambda: self.__get_all_tickers(as_of_date)
+            )
+            
+            call.rows = len(result)
+        
+        return result
+    
+    
+    def __get_all_tickers(self, as_of_date):
+        """
+            The function computes the valid tickers for the as of date, see get_all_tickers.
+        """
+        
+        with self.__stage('universe.active') as stage:
+            index = self.__get_active_ticker_index()
+            tickers = index.tickers[index.active(as_of_date)].tolist()
+            stage.rows = len(tickers)
+        
+        return tickers
+    
+    
+    @refresh_on_change
+    def get_universe_history(self, dates):
+        """
+            The function returns the valid tickers of many dates at once (e.g. the rebalance dates of a backtest).
+            The return is a boolean dataframe with the dates as index and the tickers valid on any of the dates as columns.
+            dates: list of datetime.date
+        """
+        
+        self.__sync_shared()
+        
+        dates = pd.to_datetime(pd.Series(dates)).values.astype('datetime64[D]')
+        
+        with self.__pin(), self.__trace('get_universe_history', dates=len(dates)) as call:
+            result = self.__cached(
+                lambda: ('get_universe_history', tuple(dates.astype(str))),
+                lambda: self.__get_universe_history(dates)
+            )
+            
+            call.rows = result.size
+        
+        return result
+    
+    
+    def __get_universe_history(self, dates):
+        """
+            The function computes the valid tickers of the dates, see get_universe_history.
+        """
+        
+        with self.__stage('universe.membership') as stage:
+            index = self.__get_active_ticker_index()
+            membership = index.membership(dates)
+            stage.rows = membership.size
+        
+        used = membership.any(axis=0)
+        
+        return pd.DataFrame(membership[:, used], index=pd.DatetimeIndex(dates, name='Date'), columns=index.tickers[used])
+    
+    
+    @refresh_on_change
+    def get_ticker_by_classification(self, in_, level='Sector', as_of_date=date.today()):
+        """
+            in_: List of sectors or industries
+            level: Sector (level 1), Industry (level 2)
+            as_of_date: datetime.date
+        """
+        
+        self.__sync_shared()
+        
+        with self.__pin(), self.__trace('get_ticker_by_classification') as call:
+            result = self.__cached(
+                lambda: ('get_ticker_by_classification', tuple(in_), level.title().strip(), as_of_date.strftime(FinancialDataAPI.__date_format)),
+                lambda: self.__get_ticker_by_classification(in_, level, as_of_date)
+            )
+            
+            call.rows = len(result)
+        
+        return result
+    
+    
+    def __get_ticker_by_classification(self, in_, level, as_of_date):
+        """
+            The function computes the valid tickers of the sectors or industries, see get_ticker_by_classification.
+        """
+        
+        level = level.title().strip()
+        
+        with self.__stage('description.table'):
+            table = self.__get_description_table()
+        
+        if level not in table.columns:
+            raise Exception('Err: level must be Sector or Industry.')
+        
+        tickers = table.index[table[level].isin(in_)]
+        
+        # check if price exist
+        with self.__stage('universe.active') as stage:
+            index = self.__get_active_ticker_index()
+            active = index.tickers[index.active(as_of_date)]
+            stage.rows = len(active)
+        
+        tickers_valid = active[pd.Index(tickers).get_indexer(active) >= 0].tolist()
+        
+        return tickers_valid
+    
+    
+    def __get_field_info(self, keyword):
+        """
+            The function searches the field metat data given the keyword. 
+            The keyword is used to match with the long and short name in lowercase.
+            The return is a dataframe contains all metadata related to the fields matched.
+        """
+        
+        snapshot = self.__snapshot()
+        match_df = snapshot.field_meta[snapshot.field_index.search(keyword)]
+        match_df = match_df.reset_index().copy()
+        
+        del match_df['index']
+        
+        return match_df
+    
+    
+    def display_field_info(self, keyword):
+        """
+            Search by field long and short names and display anyone contains the keyword.
+            keyword: str
+        """
+        
+        match_df = self.__get_field_info(keyword)
+        
+        for i in range(len(match_df)):
+            row = match_df.iloc[i]
+            print("{long_name} ({short_name}) \n  Parameters: {params} \n  {doc} \n\n".format(
+                long_name=row['Long Name'], short_name=row['Short Name'], 
+                params=row['params'], doc=row['doc']
+            ))
+            
+    
+    def __get_field(self, field):
+        """
+            The function retunrs the field metadata (see FieldSpec) for the given field name.
+            The name can either be long or short name. Not case sensitive.
+        """
+        
+        field_spec = self.__snapshot().field_index.get(field)
+        
+        if field_spec is None:
+            raise Exception('Err: Could not find exact matching field.')
+        
+        return field_spec
+    
+    
+    def __normalize_params(self, kwargs):
+        """
+            The function normalizes the input params once per call into a dictionary of param name -> value.
+            The param names are matched in lower case, the first one is taken if a name is given more than once.
+            String values are made lower case and Date or Datetime values are made yyyy-mm-dd strings.
+        """
+        
+        params = {}
+        
+        for param_name, value in kwargs.items():
+            param_name = param_name.lower().strip()
+            
+            if param_name not in params:
+                params[param_name] = self.__normalize_param_value(value)
+        
+        return params
+    
+    
+    def __normalize_param_value(self, value):
+        """
+            The function makes a string value lower case and a Date or Datetime value a yyyy-mm-dd string.
+        """
+        
+        if isinstance(value, str):
+            value = value.lower()
+        
+        if isinstance(value, date) or isinstance(value, datetime):
+            value = value.strftime(FinancialDataAPI.__date_format)
+        
+        return value
+    
+    
+    def __get_param_value(self, params, param_name, default_value=None):
+        """
+            The function gets the param value from the normalized params (use __normalize_params) for the given param_name -> String
+            If the param is in the input, the input value is returned
+            If the param is not in the input, the default value is returned
+            If no default value i.e. the param is a required input, the error will be raised
+        """
+        
+        if param_name in params:
+            return params[param_name]
+        
+        if default_value is None:
+            raise Exception('Err: {}= is a required parameter'.format(param_name))
+        
+        return self.__normalize_param_value(default_value)
+    
+    
+    def __get_price_store(self, data_set):
+        """
+            The function returns the price store (see PriceStore) of the data set, it is built once per load.
+        """
+        
+        data_dict = self.__snapshot().data_dict
+        
+        return data_dict.derived(('price_store', data_set), lambda: PriceStore(data_dict[data_set]), (data_set,))
+    
+    
+    def __get_fundamental_store(self, data_set):
+        """
+            The function returns the fundamental store (see FundamentalStore) of the statement, it is built once per load.
+        """
+        
+        data_dict = self.__snapshot().data_dict
+        
+        return data_dict.derived(('fundamental_store', data_set), lambda: FundamentalStore(data_dict[data_set]), (data_set,))
+    
+    
+    def __get_active_ticker_index(self):
+        """
+            The function returns the active ticker index (see ActiveTickerIndex) of the share prices, it is built once per load.
+        """
+        
+        data_dict = self.__snapshot().data_dict
+        
+        return data_dict.derived('active_tickers', lambda: ActiveTickerIndex(self.__get_price_store('shareprices-daily')), ('shareprices-daily',))
+    
+    
+    def __get_adjustment_factor(self, data_set):
+        """
+            The function returns the adjustment factor of each row of the price store (see PriceStore.adjustment_factor),
+            it is built once per load.
+        """
+        
+        data_dict = self.__snapshot().data_dict
+        
+        return data_dict.derived(('adjustment_factor', data_set), lambda: self.__get_price_store(data_set).adjustment_factor(), (data_set,))
+    
+    
+    def __get_adjusted_values(self, data_set, col, rows):
+        """
+            The function returns the adjusted prices of the column for the given rows of the price store.
+            With the adjusted price cache on, the adjusted column is built once and the rows are looked up.
+        """
+        
+        store = self.__get_price_store(data_set)
+        
+        if FinancialDataAPI.__adjusted_price_cache:
+            data_dict = self.__snapshot().data_dict
+            adjusted = data_dict.derived(('adjusted_price', data_set, col), lambda: store.column(col) * self.__get_adjustment_factor(data_set), (data_set,))
+            
+            return adjusted[rows]
+        
+        return store.column(col)[rows] * self.__get_adjustment_factor(data_set)[rows]
+    
+    
+    def __get_price_rows(self, data_set, tickers, start, end, columns, adj_columns=()):
+        """
+            The function reads the rows of the price data set for the tickers between the start and end dates (inclusive)
+            from the price store. The adj_columns are adjusted (see __get_adjusted_values).
+            The return is a tuple of the position of the ticker in tickers for each row,
+            the dates of the rows and a dictionary of column -> values of the rows.
+        """
+        
+        store = self.__get_price_store(data_set)
+        rows, ticker_pos = store.rows(tickers, start, end)
+        
+        values = {}
+        
+        for col in columns:
+            values[col] = self.__get_adjusted_values(data_set, col, rows) if col in adj_columns else store.column(col)[rows]
+        
+        return ticker_pos, store.dates[rows], values
+    
+    
+    def __sort_by_tickers(self, df, tickers, sort_cols):
+        """
+            The function sorts the dataframe in the order of the requested tickers and then by the sort_cols.
+            The position of each ticker is looked up in one vectorized pass with a ticker -> position index.
+            The return has Ticker as index.
+        """
+        
+        with self.__stage('sort_by_tickers') as stage:
+            df['Ticker Order'] = pd.Index(tickers).get_indexer(df['Ticker'])
+            df = df.sort_values(['Ticker Order'] + sort_cols)
+            del df['Ticker Order']
+            
+            df = df.set_index('Ticker')
+            stage.rows = len(df)
+        
+        return df
+    
+    
+    def __get_description_table(self):
+        """
+            The function returns all description fields of the meta in one dataframe with Ticker as index.
+            It is built once per load: the fields joining the same data sets share one merge.
+        """
+        
+        snapshot = self.__snapshot()
+        
+        depends_on = set()
+        
+        for field_spec in snapshot.field_index.specs:
+            if field_spec.func == 'get_description_data':
+                depends_on.update(field_spec.data_sets)
+        
+        return snapshot.data_dict.derived('description_table', self.__build_description_table, tuple(depends_on))
+    
+    
+    def __build_description_table(self):
+        """
+            The function builds the description table, see __get_description_table.
+        """
+        
+        snapshot = self.__snapshot()
+        join_dict = {}
+        
+        for field_spec in snapshot.field_index.specs:
+            if field_spec.func == 'get_description_data':
+                join_dict.setdefault((field_spec.data_set, field_spec.join_key), []).append(field_spec.long_name)
+        
+        tables = []
+        
+        for (data_set, join_key), field_long_names in join_dict.items():
+            data_set = data_set.split(',')
+            join_key = join_key.split(',')
+            
+            df = snapshot.data_dict[data_set[0]]
+            
+            if len(data_set) > 1:
+                for i in range(1, len(data_set)):
+                    df = pd.merge(df, snapshot.data_dict[data_set[i]], how='left', on=join_key[i-1], suffixes=('', '_r'))
+            
+            df = df[df['Ticker'].notna()].drop_duplicates('Ticker')
+            tables.append(df.set_index('Ticker')[field_long_names])
+        
+        if len(tables) == 0:
+            return pd.DataFrame(index=pd.Index([], name='Ticker'))
+        
+        table = pd.concat(tables, axis=1)
+        table.index.name = 'Ticker'
+        
+        return table
+    
+    
+    def __get_description_data(self, tickers, field_specs, params):
+        """
+            The function retrieves the description data
+            for a given list of tickers and a list of field metadata (use __get_field).
+            The fields must be description data. They are gathered from the description table by ticker.
+        """
+        
+        with self.__stage('description.table'):
+            table = self.__get_description_table()
+        
+        with self.__stage('description.reindex') as stage:
+            df = table.reindex(pd.Index(tickers, name='Ticker'))[[field_spec.long_name for field_spec in field_specs]]
+            stage.rows = len(df)
+        
+        return df
+    
+    
+    def __get_calendar_dates(self, data_set, calendar, start, end):
+        """
+            The function returns the sorted dates between start and end (inclusive) of the calendar as datetime64 array.
+            calendar: 'all' for every calendar date, 'trading' for the dates with prices in the data set,
+            or a list of dates
+        """
+        
+        start = np.datetime64(start, 'ns')
+        end = np.datetime64(end, 'ns')
+        
+        if isinstance(calendar, str):
+            if calendar == 'all':
+                return pd.date_range(start=start, end=end).values
+            elif calendar == 'trading':
+                data_dict = self.__snapshot().data_dict
+                dates = data_dict.derived(('trading_dates', data_set), lambda: np.unique(self.__get_price_store(data_set).dates), (data_set,))
+            else:
+                raise Exception('Err: calendar= must be all, trading or a list of dates.')
+        else:
+            dates = np.unique(pd.to_datetime(list(calendar)).values.astype('datetime64[ns]'))
+        
+        return dates[np.searchsorted(dates, start, side='left'):np.searchsorted(dates, end, side='right')]
+    
+    
+    def __forward_fill(self, panel, panel_dates, seed_values, seed_dates, fill_limit):
+        """
+            The function forward fills a (date x ticker) panel in one NumPy pass.
+            A missing value takes the last value before it in the column, or the seed of the ticker
+            (its last observation before the first date) if there is none.
+            If fill_limit is not -1, a value older than fill_limit days is not carried.
+        """
+        
+        n_dates = len(panel_dates)
+        
+        last = np.where(np.isnan(panel), -1, np.arange(n_dates)[:, None])
+        np.maximum.accumulate(last, axis=0, out=last)
+        
+        seeded = last < 0
+        filled = np.take_along_axis(panel, np.maximum(last, 0), axis=0)
+        filled[seeded] = np.broadcast_to(seed_values, panel.shape)[seeded]
+        
+        if fill_limit != -1:
+            days = panel_dates.astype('datetime64[D]').astype(np.int64)
+            seed_days = np.where(np.isnat(seed_dates), np.iinfo(np.int64).min // 2, seed_dates.astype('datetime64[D]').astype(np.int64))
+            
+            observed = np.where(seeded, np.broadcast_to(seed_days, panel.shape), days[np.maximum(last, 0)])
+            filled[days[:, None] - observed > fill_limit] = np.NaN
+        
+        return filled
+    
+    
+    def __build_panels(self, ticker_pos, row_dates, values, n_tickers, dates, fill_prev, seeds=None, fill_limit=-1):
+        """
+            The function works with pricing and market data fucntion.
+            It scatters the rows (see __get_price_rows) into a dense (date x ticker) panel per column on the given dates.
+            If fill_prev is True, the values are forward filled per ticker on the dates of the rows as well,
+            starting from the seeds (column -> (values, dates) of the last observation per ticker),
+            before the panel is restricted to the given dates.
+            The return is a dictionary of column -> panel.
+        """
+        
+        all_dates = np.union1d(dates, row_dates) if fill_prev else dates
+        
+        date_pos = np.minimum(np.searchsorted(all_dates, row_dates), max(len(all_dates) - 1, 0))
+        on_date = all_dates[date_pos] == row_dates if len(all_dates) else np.zeros(len(row_dates), dtype=bool)
+        
+        keep = np.isin(all_dates, dates)
+        panels = {}
+        
+        for col, col_values in values.items():
+            panel = np.full((len(all_dates), n_tickers), np.NaN)
+            panel[date_pos[on_date], ticker_pos[on_date]] = col_values[on_date]
+            
+            if fill_prev:
+                seed_values, seed_dates = seeds[col]
+                panel = self.__forward_fill(panel, all_dates, seed_values, seed_dates, fill_limit)
+            
+            panels[col] = panel[keep]
+        
+        return panels
+    
+    
+    def __get_price_seeds(self, data_set, tickers, start, columns, adj_columns):
+        """
+            The function returns the last observation before start of each ticker for each column
+            as a dictionary column -> (values, dates), read from the price store with a binary search.
+            The adj_columns are adjusted (see __get_adjusted_values).
+        """
+        
+        store = self.__get_price_store(data_set)
+        seeds = {}
+        
+        for col in columns:
+            values = store.column(col)
+            
+            if col in adj_columns:
+                value_of = lambda rows, col=col: self.__get_adjusted_values(data_set, col, rows)
+            else:
+                value_of = lambda rows, values=values: values[rows]
+            
+            seeds[col] = store.last_valid(tickers, start, value_of)
+        
+        return seeds
+    
+    
+    def __get_price_data(self, tickers, field_specs, params):
+        """
+            The function retrieves the pricing and market data
+            for a given list of tickers and a list of field metadata (use __get_field).
+            The fields must be pricing or market data of the same data set.
+            All fields are read, expanded to calendar dates and forward filled in one pass.
+            With fill_prev, each ticker starts from its last observation before start, however old it is,
+            unless fill_limit caps the age (in days) of a carried value.
+            
+            Param:
+            start -> Date = required
+            end -> Date = required
+            adj -> String [y/n] = y (pricing data only)
+            fill_prev -> String [y/n]
+            fill_limit -> Int = -1 (no limit)
+            calendar -> String [all/trading] or list of Date = all
+            layout -> String [long/panel] = long
+        """
+        
+        data_set = field_specs[0].data_set
+        field_long_names = [field_spec.long_name for field_spec in field_specs]
+        adj_field_long_names = [field_spec.long_name for field_spec in field_specs if field_spec.func == 'get_pricing_data']
+        
+        if any(field_spec.data_set != data_set for field_spec in field_specs):
+            raise Exception('Err: The pricing and market fields must come from the same data set.')
+        
+        start = self.__get_param_value(params, 'start')
+        end = self.__get_param_value(params, 'end')
+        adj = self.__get_param_value(params, 'adj', 'y')
+        fill_prev = self.__get_param_value(params, 'fill_prev', 'n')
+        fill_limit = int(self.__get_param_value(params, 'fill_limit', -1))
+        calendar = self.__get_param_value(params, 'calendar', 'all')
+        layout = self.__get_param_value(params, 'layout', 'long')
+        
+        adj_columns = adj_field_long_names if adj == 'y' else []
+        
+        with self.__stage('price.rows') as stage:
+            ticker_pos, row_dates, values = self.__get_price_rows(data_set, tickers, start, end, field_long_names, adj_columns)
+            stage.rows = len(row_dates)
+        
+        seeds = None
+        
+        if fill_prev == 'y':
+            with self.__stage('price.seeds') as stage:
+                seeds = self.__get_price_seeds(data_set, tickers, start, field_long_names, adj_columns)
+                stage.rows = len(tickers)
+        
+        with self.__stage('price.calendar') as stage:
+            dates = self.__get_calendar_dates(data_set, calendar, start, end)
+            stage.rows = len(dates)
+        
+        with self.__stage('price.panels') as stage:
+            panels = self.__build_panels(ticker_pos, row_dates, values, len(tickers), dates, fill_prev == 'y', seeds, fill_limit)
+            stage.rows = len(dates) * len(tickers)
+        
+        if layout == 'panel':
+            return {col: Panel(dates, np.asarray(tickers, dtype=object), panels[col]) for col in field_long_names}
+        
+        # the long form is ordered by the tickers of the request, then by date
+        with self.__stage('price.frame') as stage:
+            df = pd.DataFrame({'Ticker': np.repeat(np.asarray(tickers, dtype=object), len(dates)), 'Date': np.tile(dates, len(tickers))})
+            
+            for col in field_long_names:
+                df[col] = panels[col].T.ravel()
+            
+            df = df.set_index('Ticker')
+            stage.rows = len(df)
+        
+        return df
+    
+    
+    def __fundamental_get_raw_data(self, data_set_name, tickers, field_long_names, as_of_date):
+        """
+            The function gets the raw fundamental data for the given tickers, list of fields and as of date:
+            the latest publication of each report known on the as of date (see FundamentalStore.known_reports),
+            sorted by Ticker and Report Date.
+        """
+        
+        df = self.__snapshot().data_dict[data_set_name]
+        
+        # free version of the bulk data from SimFin doesn't provide full restated history
+        # if use the paid version, then use 'Restated Date' otherwise use 'Publish Date'
+        with self.__stage('fundamental.reports') as stage:
+            store = self.__get_fundamental_store(data_set_name)
+            _, _, _, rows = store.known_reports(tickers, [np.datetime64(as_of_date, 'D')])
+            stage.rows = len(rows)
+        
+        cols = df.columns.tolist()
+        fixed_cols = [c for c in cols[:cols.index('Restated Date') + 1] if c != 'SimFinId']
+        
+        df = df.iloc[rows][fixed_cols + field_long_names]
+        df.insert(len(fixed_cols), 'As of Date', pd.Timestamp(as_of_date))
+        
+        return df.sort_values(['Ticker', 'Report Date'])
+    
+    
+    def __fundamental_fill_missing_tickers(self, df, tickers, as_of_date):
+        """
+            The function check if all tickers in the df index, if no means no data and will fill the ticker with NaN
+        """
+        
+        with self.__stage('fundamental.fill_missing') as stage:
+            if 'Ticker' in df.columns.tolist():
+                df = df.set_index('Ticker')
+            
+            missing_tickers = pd.Index(tickers).difference(df.index, sort=False)
+            if len(missing_tickers):
+                # one row of NaN per missing ticker, the columns are upcast like an enlargement with .loc
+                missing = df.iloc[:0].reindex(pd.Index(missing_tickers, name=df.index.name))
+                missing['As of Date'] = pd.to_datetime(as_of_date, format=FinancialDataAPI.__date_format)
+                df = pd.concat([df, missing])
+            
+            stage.rows = len(missing_tickers)
+            
+        return df.reset_index()
+    
+    
+    def __fundamental_point_in_time(self, data_set_name, tickers, field_long_names, offset_start, offset_end, as_of_dates):
+        """
+            The point in time engine for the offset periods.
+            For each ticker and as of date, it selects the offset periods among the reports known on the as of date,
+            using the latest publication of each report (see FundamentalStore.known_reports).
+            Every distinct set of known reports is evaluated once in a vectorized pass
+            and repeated for the as of dates sharing it.
+            The offset periods are selected like .iloc[offset_start-1:offset_end+1] on the reports sorted by report date.
+            Tickers without data get one row of NaN for the as of date.
+            The return is not sorted.
+        """
+        
+        df = self.__snapshot().data_dict[data_set_name]
+        
+        as_of_dates = np.unique(pd.to_datetime(as_of_dates).values.astype('datetime64[D]'))
+        
+        cols = df.columns.tolist()
+        fixed_cols = [c for c in cols[:cols.index('Restated Date') + 1] if c != 'SimFinId']
+        
+        num_tickers = len(tickers)
+        num_dates = len(as_of_dates)
+        q_codes = np.repeat(np.arange(num_tickers), num_dates)
+        q_days = np.tile(as_of_dates.astype(np.int64), num_tickers)
+        
+        with self.__stage('fundamental.reports') as stage:
+            store = self.__get_fundamental_store(data_set_name)
+            q_state, num_states, state_id, rows = store.known_reports(tickers, as_of_dates)
+            stage.rows = len(rows)
+        
+        # select the offset periods with the .iloc slice semantic
+        num_reports = np.bincount(state_id, minlength=num_states)
+        first_pos = np.cumsum(num_reports) - num_reports
+        pos = np.arange(len(rows)) - first_pos[state_id]
+        n = num_reports[state_id]
+        
+        if offset_start == offset_end:
+            i = offset_end - 1
+            selected = pos == (n + i if i < 0 else i)
+        else:
+            lo = offset_start - 1
+            lo = np.clip(n + lo if lo < 0 else np.full(len(n), lo), 0, n)
+            
+            if offset_end < 0:
+                hi = offset_end + 1
+                hi = np.clip(n + hi if hi < 0 else np.full(len(n), hi), 0, n)
+            else:
+                hi = n
+            
+            selected = (pos >= lo) & (pos < hi)
+        
+        state_id, rows = state_id[selected], rows[selected]
+        
+        # repeat the selected reports of the state for every as of date, or one empty row if nothing is selected
+        num_selected = np.bincount(state_id, minlength=num_states)
+        first_selected = np.cumsum(num_selected) - num_selected
+        
+        num_out = np.maximum(num_selected[q_state], 1)
+        out_query = np.repeat(np.arange(len(q_codes)), num_out)
+        out = concat_ranges(first_selected[q_state], num_out)
+        
+        has_row = np.repeat(num_selected[q_state], num_out) > 0
+        out_rows = np.full(len(out), -1, dtype=np.int64)
+        out_rows[has_row] = rows[out[has_row]]
+        
+        result = pd.DataFrame({'Ticker': np.asarray(tickers, dtype=object)[q_codes[out_query]]})
+        
+        for col in fixed_cols[1:]:
+            result[col] = pd.api.extensions.take(df[col].values, out_rows, allow_fill=True)
+        
+        result['As of Date'] = q_days[out_query].astype('datetime64[D]').astype('datetime64[ns]')
+        
+        for col in field_long_names:
+            result[col] = pd.api.extensions.take(df[col].values, out_rows, allow_fill=True)
+        
+        return result
+    
+    
+    def __fundamental_offset_period(self, data_set_name, tickers, field_long_names, offset_start, offset_end, as_of_date):
+        """
+            The function gets the fundamental data for the given offset periods
+        """
+        
+        with self.__stage('fundamental.point_in_time') as stage:
+            df = self.__fundamental_point_in_time(data_set_name, tickers, field_long_names, offset_start, offset_end, [as_of_date])
+            stage.rows = len(df)
+        
+        # make sure the ticker order is the same as the request
+        df = self.__sort_by_tickers(df, tickers, ['As of Date', 'Report Date'])
+        
+        return df
+    
+    
+    def __fundamental_offset_period_aod_range(self, data_set_name, tickers, field_long_names, offset_start, offset_end, as_of_date_start, as_of_date_end):
+        """
+            The function gets the offset period data for a given as of date range.
+            All the as of dates are evaluated in one pass by the point in time engine.
+            A ticker without reports known on an as of date gets one row of NaN for it,
+            so the result of a set of tickers doesn't depend on the other tickers of the request (see iter_data).
+        """
+        
+        with self.__stage('fundamental.point_in_time') as stage:
+            df = self.__fundamental_point_in_time(
+                data_set_name, tickers, field_long_names, offset_start, offset_end, pd.date_range(start=as_of_date_start, end=as_of_date_end)
+            )
+            stage.rows = len(df)
+        
+        # make sure the ticker order is the same as the request
+        df = self.__sort_by_tickers(df, tickers, ['As of Date', 'Publish Date'])
+        
+        return df
+    
+    
+    def __fundamental_absolute_period_q_ttm(self, data_set_name, tickers, field_long_names, y_start, q_start, y_end, q_end, as_of_date):
+        """
+            The function gets the quarterly and last 12 months fundamental data for the given absolute periods
+        """
+            
+        df = self.__fundamental_get_raw_data(data_set_name, tickers, field_long_names, as_of_date)
+        
+        with self.__stage('fundamental.periods') as stage:
+            df['Quarter'] = df['Fiscal Period'].str[-1:].astype(int)
+            
+            df = df[
+                (df['Fiscal Year'] >= y_start) & (df['Fiscal Year'] <= y_end)
+                & (df['Quarter'] >= q_start) & (df['Quarter'] <= q_end)
+            ]
+            stage.rows = len(df)
+        
+        cols = [c for c in df.columns.tolist() if c != 'Quarter']
+        df = df[cols]
+        
+        # add missing tickers
+        df = self.__fundamental_fill_missing_tickers(df, tickers, as_of_date)
+        
+        # make sure the ticker order is the same as the request
+        df = df.reset_index()
+        df = self.__sort_by_tickers(df, tickers, ['As of Date', 'Publish Date'])
+        del df['index']
+        
+        return df.copy()
+    
+    
+    def __fundamental_absolute_period_a(self, data_set_name, tickers, field_long_names, y_start, y_end, as_of_date):
+        """
+            The function gets the annually fundamental data for the given absolute periods
+        """
+        
+        df = self.__fundamental_get_raw_data(data_set_name, tickers, field_long_names, as_of_date)
+        
+        with self.__stage('fundamental.periods') as stage:
+            df = df[
+                (df['Fiscal Year'] >= y_start) & (df['Fiscal Year'] <= y_end)
+            ]
+            stage.rows = len(df)
+        
+        # add missing tickers
+        df = self.__fundamental_fill_missing_tickers(df, tickers, as_of_date)
+        
+        # make sure the ticker order is the same as the request
+        df = df.reset_index()
+        df = self.__sort_by_tickers(df, tickers, ['As of Date', 'Publish Date'])
+        del df['index']
+        
+        return df.copy()
+    
+    
+    def __get_fundamental_data(self, tickers, field_specs, params):
+        """
+            The function retrieves the fundamental data
+            for a given list of tickers and a list of field metadata as dictionary (use __get_field).
+            The fields must be fundamental data of the same statement, they share one pass over the statement.
+            
+            Param:
+            Period Type: pt -> String [q/a/ttm] = ttm
             
             Offset Start: offset_start -> Int = 0
             Offset End: offset_end -> Int = 0
@@ -591,22 +3126,25 @@ class FinancialDataAPI:
             As of Date End: as_of_date_end -> Date = date.today()
         """
         
-        data_set_list = field_dict['data_set'].split('/')
+        data_set_list = field_specs[0].data_set.split('/')
         data_set_dict = {d.split('-')[1]:d for d in data_set_list}
-        field_long_name = field_dict['Long Name']
+        field_long_names = [field_spec.long_name for field_spec in field_specs]
+        
+        if any(field_spec.data_set != field_specs[0].data_set for field_spec in field_specs):
+            raise Exception('Err: The fundamental fields must come from the same statement.')
         
-        pt = self.__get_param_value('pt', 'ttm', **kwargs)
+        pt = self.__get_param_value(params, 'pt', 'ttm')
         
         y_q_none = -1
         
-        y_start = self.__get_param_value('y_start', y_q_none, **kwargs)
-        y_end = self.__get_param_value('y_end', y_q_none, **kwargs)
+        y_start = self.__get_param_value(params, 'y_start', y_q_none)
+        y_end = self.__get_param_value(params, 'y_end', y_q_none)
         
-        q_start = self.__get_param_value('q_start', y_q_none, **kwargs)
-        q_end = self.__get_param_value('q_end', y_q_none, **kwargs)
+        q_start = self.__get_param_value(params, 'q_start', y_q_none)
+        q_end = self.__get_param_value(params, 'q_end', y_q_none)
         
-        offset_start = self.__get_param_value('offset_start', 0, **kwargs)
-        offset_end = self.__get_param_value('offset_end', 0, **kwargs)
+        offset_start = self.__get_param_value(params, 'offset_start', 0)
+        offset_end = self.__get_param_value(params, 'offset_end', 0)
         offset = offset_end
         
         if pt == 'q':
@@ -616,8 +3154,8 @@ class FinancialDataAPI:
         elif pt == 'ttm':
             data_set_name = data_set_dict['ttm']
         
-        as_of_date_start = self.__get_param_value('as_of_date_start', date.today(), **kwargs)
-        as_of_date_end = self.__get_param_value('as_of_date_end', date.today(), **kwargs)
+        as_of_date_start = self.__get_param_value(params, 'as_of_date_start', date.today())
+        as_of_date_end = self.__get_param_value(params, 'as_of_date_end', date.today())
         as_of_date = as_of_date_end # default as of date is the as of date end
         
         # default is only one as of date and is_as_of_date_range is False
@@ -640,7 +3178,7 @@ class FinancialDataAPI:
                     else:
                         # get data for the given period
                         return self.__fundamental_absolute_period_q_ttm(
-                            data_set_name, tickers, field_long_name, y_start, q_start, y_end, q_end, as_of_date
+                            data_set_name, tickers, field_long_names, y_start, q_start, y_end, q_end, as_of_date
                         )
                 else:
                     raise Exception('Err: Missing start end year or quarter.')
@@ -655,7 +3193,7 @@ class FinancialDataAPI:
                     else:
                         # get data for the given period
                         return self.__fundamental_absolute_period_a(
-                            data_set_name, tickers, field_long_name, y_start, y_end, as_of_date
+                            data_set_name, tickers, field_long_names, y_start, y_end, as_of_date
                         )
                 else:
                     raise Exception('Err: Missing start end year.')
@@ -664,35 +3202,705 @@ class FinancialDataAPI:
         if is_as_of_date_range:
             # request as of date range for the given offset period
             return self.__fundamental_offset_period_aod_range(
-                data_set_name, tickers, field_long_name, offset_start, offset_end, as_of_date_start, as_of_date_end
+                data_set_name, tickers, field_long_names, offset_start, offset_end, as_of_date_start, as_of_date_end
             )
         else:
             return self.__fundamental_offset_period(
-                data_set_name, tickers, field_long_name, offset_start, offset_end, as_of_date
+                data_set_name, tickers, field_long_names, offset_start, offset_end, as_of_date
             )
         
     
+    @refresh_on_change
     def get_data(self, tickers, field, **kwargs):
         """
             The function returns the data as dataframe
-            for a given list of tickers and a field name.
-            Only one field is allowed.
+            for a given list of tickers and a field name or a list of field names.
+            With a list, the return has one column per field. The fields are grouped by category and data set
+            and each group is read, expanded and filled once.
+            Description fields can be combined with any other fields.
+            Pricing/market fields can't be combined with fundamental fields,
+            and fundamental fields must come from the same statement.
             If field is not found, the exception will be raised.
+            If the result cache is enabled (see enable_result_cache), the result is memoized.
+            With layout='panel' (pricing and market data only), the return is a dense (date x ticker) Panel
+            with .dates, .tickers and .values (a 2-D array), or a dictionary of field -> Panel for a list of fields.
+        """
+        
+        self.__sync_shared()
+        
+        with self.__pin(), self.__trace('get_data') as call:
+            with self.__stage('request'):
+                tickers, field_specs = self.__get_request(tickers, field)
+                params = self.__normalize_params(kwargs)
+            
+            call.annotate(tickers=len(tickers), fields=[fs.long_name for fs in field_specs])
+            
+            result = self.__cached(
+                lambda: self.__get_data_key(tickers, field_specs, params),
+                lambda: self.__get_data(tickers, field_specs, params)
+            )
+            
+            call.rows = Profiler.count_rows(result)
+        
+        return self.__unwrap_panel(result, field)
+    
+    
+    def iter_data(self, tickers, field, chunk_by='ticker', chunk_size=None, **kwargs):
+        """
+            The function works like get_data, but it yields the data in chunks,
+            so only the data of one chunk is in memory at a time.
+            chunk_by: ticker or date
+            - ticker: each chunk has the data of chunk_size tickers (500 by default).
+              The chunks concatenated are exactly the return of get_data.
+            - date: each chunk has the data of all tickers for chunk_size days (365 by default) between start and end,
+              pricing and market data only. With fill_prev, each chunk is forward filled from the last price
+              before its first date, so the values are the same as get_data.
+              The derived fields looking back with shift or pct_change (e.g. Daily Return) can't be chunked by date,
+              as the first date of a chunk would have no previous row.
+              The chunks concatenated are ordered by date chunk first, then by ticker.
+            With layout='panel', each chunk is a Panel or a dictionary of Panels, see get_data.
+            The result cache is not used. If a data set has changed on the drive since the load,
+            the data sets are refreshed before the first chunk (see refresh_on_change).
+        """
+        
+        self.__sync_shared()
+        
+        # all the chunks are read from the same data, even if the data sets are reloaded between two chunks
+        with self.__pin() as snapshot:
+            tickers, field_specs = self.__get_request(tickers, field)
+        
+        params = self.__normalize_params(kwargs)
+        chunk_by = chunk_by.lower().strip()
+        
+        if chunk_by == 'ticker':
+            chunk_size = chunk_size or 500
+            chunks = [(tickers[i:i + chunk_size], params) for i in range(0, len(tickers), chunk_size)]
+        elif chunk_by == 'date':
+            base_specs = self.__base_specs(field_specs)
+            
+            if not any(fs.func in ('get_pricing_data', 'get_market_data') for fs in base_specs) or any(fs.func == 'get_fundamental_data' for fs in base_specs):
+                raise Exception('Err: Only pricing and market data can be chunked by date.')
+            
+            lagged = [fs.long_name for fs in field_specs if fs.expression is not None and fs.expression.lagged]
+            
+            if len(lagged):
+                raise Exception('Err: {} looks back with shift or pct_change and cannot be chunked by date.'.format(', '.join(lagged)))
+            
+            chunk_size = chunk_size or 365
+            
+            start = np.datetime64(self.__get_param_value(params, 'start'), 'D')
+            end = np.datetime64(self.__get_param_value(params, 'end'), 'D')
+            chunks = []
+            
+            while start <= end:
+                chunk_end = min(start + chunk_size - 1, end)
+                chunks.append((tickers, dict(params, start=str(start), end=str(chunk_end))))
+                start = chunk_end + 1
+        else:
+            raise Exception('Err: chunk_by= must be ticker or date.')
+        
+        for i, (chunk_tickers, chunk_params) in enumerate(chunks):
+            try:
+                result = self.__get_data_chunk(snapshot, chunk_tickers, field_specs, chunk_params)
+            except DataSetChangedError:
+                # the data sets are read by the first chunk, so the iteration can still start on the refreshed data
+                if i > 0:
+                    raise
+                
+                self.refresh_data_sets()
+                
+                with self.__pin() as snapshot:
+                    result = self.__get_data_chunk(snapshot, chunk_tickers, field_specs, chunk_params)
+            
+            yield self.__unwrap_panel(result, field)
+    
+    
+    def __get_data_chunk(self, snapshot, tickers, field_specs, params):
+        """
+            The function returns one chunk of iter_data read from the snapshot, it is profiled as a call.
+        """
+        
+        with self.__pin(snapshot), self.__trace('iter_data', tickers=len(tickers), fields=[fs.long_name for fs in field_specs]) as call:
+            result = self.__get_data(tickers, field_specs, params)
+            call.rows = Profiler.count_rows(result)
+        
+        return result
+    
+    
+    @refresh_on_change
+    def get_snapshots(self, tickers, field, dates, **kwargs):
+        """
+            The function returns the data of the tickers as known on each of the given dates as dataframe
+            indexed by (Date, Ticker), ordered by date and then by the requested tickers, with one column per field.
+            It replaces a get_data call per rebalance date of a backtest: every data set is read in one pass for all dates.
+            - pricing and market data: the last value on or before the date (like fill_prev='y'),
+              adj and fill_limit (in days) work as in get_data
+            - fundamental data: the report of the offset period published on or before the date (the as of date),
+              pt and offset_start = offset_end select the period
+            - description data: the same value on every date
+            Pricing, market, fundamental and description fields can be combined.
+            If the result cache is enabled (see enable_result_cache), the result is memoized.
+        """
+        
+        self.__sync_shared()
+        
+        with self.__pin(), self.__trace('get_snapshots') as call:
+            with self.__stage('request'):
+                tickers, field_specs = self.__get_request(tickers, field)
+                params = self.__normalize_params(kwargs)
+                dates = self.__get_snapshot_dates(dates)
+            
+            call.annotate(tickers=len(tickers), fields=[fs.long_name for fs in field_specs], dates=len(dates))
+            
+            result = self.__cached(
+                lambda: self.__get_snapshots_key(tickers, field_specs, dates, params),
+                lambda: self.__get_snapshots(tickers, field_specs, dates, params)
+            )
+            
+            call.rows = len(result)
+        
+        return result
+    
+    
+    def __base_specs(self, field_specs):
+        """
+            The function returns the fields read by a list of fields: the derived fields are replaced by their base fields.
+        """
+        
+        return list({fs.long_name: fs for field_spec in field_specs for fs in (field_spec.bases or (field_spec,))}.values())
+    
+    
+    def __get_derived_data(self, tickers, field_specs, params, dates=None):
+        """
+            The function returns the data of a request with derived fields (see FieldExpression),
+            for get_data or, if dates are given, for get_snapshots:
+            - the base fields read by the requested and the derived fields are collected through the references
+              and grouped by the params overridden in the references (e.g. [Close|adj=n]),
+              so each data set is read once per group, once in all if no reference overrides a param
+            - the expressions are evaluated on the columns read, the values several derived fields
+              have in common (a referenced derived field or a sub-expression) are computed once
+            In get_data, a reference only overrides the params keeping the rows unchanged (adj, fill_prev, fill_limit),
+            as the values of all the groups are combined row by row.
+        """
+        
+        field_index = self.__snapshot().field_index
+        groups = {(): {}}
+        visited = set()
+        
+        def collect(field_spec, overrides):
+            if (field_spec.long_name, overrides) in visited:
+                return
+            
+            visited.add((field_spec.long_name, overrides))
+            
+            if field_spec.expression is None:
+                group = tuple((name, value) for name, value in overrides if name in field_spec.params)
+                groups.setdefault(group, {})[field_spec.long_name] = field_spec
+            else:
+                for long_name, ref_overrides in field_spec.expression.references(overrides):
+                    collect(field_index.get(long_name), ref_overrides)
+        
+        for field_spec in field_specs:
+            collect(field_spec, ())
+        
+        if dates is None and any(name not in ('adj', 'fill_prev', 'fill_limit') for group in groups for name, _ in group):
+            raise Exception('Err: get_data only supports adj, fill_prev and fill_limit in the field references, use get_snapshots.')
+        
+        results = {}
+        
+        for group, group_specs in groups.items():
+            if len(group_specs):
+                group_params = dict(params, **dict(group))
+                
+                if dates is None:
+                    results[group] = self.__get_data(tickers, list(group_specs.values()), group_params)
+                else:
+                    results[group] = self.__get_snapshots(tickers, list(group_specs.values()), dates, group_params)
+        
+        main = results.get((), next(iter(results.values())))
+        is_panel = isinstance(main, dict)
+        
+        def value_of(long_name, overrides):
+            field_spec = field_index.get(long_name)
+            
+            if field_spec.expression is not None:
+                return field_spec.expression.evaluate(value_of, shift, memo, overrides)
+            
+            values = results[tuple((name, value) for name, value in overrides if name in field_spec.params)][long_name].values
+            
+            return values.astype(np.float64) if values.dtype == object else values
+        
+        ticker_codes = []
+        
+        def shift(values, n):
+            if is_panel:
+                shifted = np.full(values.shape, np.NaN)
+                
+                if abs(n) < len(values):
+                    shifted[max(n, 0):len(values) + min(n, 0)] = values[max(-n, 0):len(values) - max(n, 0)]
+                
+                return shifted
+            
+            if not len(ticker_codes):
+                ticker_codes.append(pd.factorize(main.index.get_level_values('Ticker'))[0])
+            
+            return pd.Series(values).groupby(ticker_codes[0]).shift(n).values
+        
+        memo = {}
+        columns = {}
+        
+        with self.__stage('derived.evaluate'):
+            for field_spec in field_specs:
+                if field_spec.expression is not None:
+                    columns[field_spec.long_name] = field_spec.expression.evaluate(value_of, shift, memo)
+        
+        requested = [field_spec.long_name for field_spec in field_specs]
+        
+        if is_panel:
+            panel = next(iter(main.values()))
+            
+            return {
+                col: main[col] if col not in columns else Panel(panel.dates, panel.tickers, np.broadcast_to(columns[col], panel.values.shape).copy())
+                for col in requested
+            }
+        
+        if dates is not None:
+            return pd.DataFrame({col: columns[col] if col in columns else main[col].values for col in requested}, index=main.index)
+        
+        # the base fields only read for the derived fields are left out
+        df = main.drop(columns=[col for specs in groups.values() for col in specs if col in main.columns and col not in requested])
+        
+        for col in requested:
+            if col in columns:
+                df[col] = columns[col]
+        
+        # the fields in the order of the request, after the key columns (e.g. Date)
+        return df[[col for col in df.columns if col not in requested] + requested]
+    
+    
+    def __unwrap_panel(self, result, field):
+        """
+            The function returns the only panel of a panel layout result (dictionary of field -> Panel)
+            if a single field name was requested.
+        """
+        
+        if isinstance(result, dict) and not isinstance(field, (list, tuple)):
+            return next(iter(result.values()))
+        
+        return result
+    
+    
+    def __get_request(self, tickers, field):
+        """
+            The function returns the unique list of tickers and the unique list of field metadata (use __get_field)
+            of a request, see get_data.
         """
         
         # make sure the ticker list is unique
         tickers = [tk.upper().strip() for tk in list(dict.fromkeys(tickers))]
         
-        field_dict = self.__get_field(field)
+        fields = field if isinstance(field, (list, tuple)) else [field]
         
-        func_dict = {
-            'get_description_data': self.__get_description_data,
-            'get_pricing_data': self.__get_pricing_data,
-            'get_market_data': self.__get_market_data,
-            'get_fundamental_data': self.__get_fundamental_data,
-        }
+        # make sure the field list is unique
+        field_specs = list({fs.long_name: fs for fs in [self.__get_field(f) for f in fields]}.values())
+        
+        return tickers, field_specs
+    
+    
+    def __get_data(self, tickers, field_specs, params):
+        """
+            The function returns the data as dataframe for a given unique list of tickers
+            and a unique list of field metadata (use __get_field) with the normalized params. See get_data.
+        """
+        
+        if any(field_spec.expression is not None for field_spec in field_specs):
+            return self.__get_derived_data(tickers, field_specs, params)
+        
+        # group the fields by the function reading them
+        group_dict = {}
+        
+        for field_spec in field_specs:
+            group_dict.setdefault(FinancialDataAPI.__func_group[field_spec.func], []).append(field_spec)
+        
+        description_specs = group_dict.pop('get_description_data', [])
+        
+        layout = self.__get_param_value(params, 'layout', 'long')
+        
+        if layout not in ('long', 'panel'):
+            raise Exception('Err: layout= must be long or panel.')
+        
+        if layout == 'panel' and (len(description_specs) or list(group_dict) != ['get_pricing_data']):
+            raise Exception('Err: layout=panel is only available for pricing and market data.')
+        
+        if len(group_dict) > 1:
+            raise Exception('Err: Pricing and market data can not be combined with fundamental data.')
+        
+        if not len(group_dict):
+            return self.__get_description_data(tickers, description_specs, params)
+        
+        func_name, group_specs = group_dict.popitem()
+        
+        df = FinancialDataAPI.__func_dict[func_name](self, tickers, group_specs, params)
+        
+        if len(description_specs):
+            description_df = self.__get_description_data(tickers, description_specs, params)
+            description_df = description_df[~description_df.index.duplicated()]
+            
+            with self.__stage('description.merge') as stage:
+                for col in description_df.columns:
+                    df[col] = description_df[col].reindex(df.index).values
+                
+                stage.rows = len(df)
+        
+        return df
+    
+    
+    def __get_snapshots(self, tickers, field_specs, dates, params):
+        """
+            The function returns the snapshots for a given unique list of tickers, a unique list of field metadata
+            (use __get_field) and the sorted unique dates with the normalized params. See get_snapshots.
+            The fields are grouped by data set and each group is answered for all (date, ticker) pairs at once.
+        """
+        
+        if any(field_spec.expression is not None for field_spec in field_specs):
+            return self.__get_derived_data(tickers, field_specs, params, dates)
+        
+        index = pd.MultiIndex.from_product([pd.DatetimeIndex(dates), pd.Index(tickers, dtype=object)], names=['Date', 'Ticker'])
+        
+        group_dict = {}
+        
+        for field_spec in field_specs:
+            func_name = FinancialDataAPI.__func_group[field_spec.func]
+            group_dict.setdefault((func_name, field_spec.data_set), []).append(field_spec)
+        
+        columns = {}
+        
+        for (func_name, data_set), group_specs in group_dict.items():
+            if func_name == 'get_pricing_data':
+                with self.__stage('snapshot.price') as stage:
+                    columns.update(self.__get_price_snapshots(tickers, group_specs, dates, params))
+                    stage.rows = len(index)
+            elif func_name == 'get_fundamental_data':
+                with self.__stage('snapshot.fundamental') as stage:
+                    columns.update(self.__get_fundamental_snapshots(tickers, group_specs, dates, params))
+                    stage.rows = len(index)
+            else:
+                table = self.__get_description_data(tickers, group_specs, params)
+                
+                for col in table.columns:
+                    columns[col] = np.tile(table[col].values, len(dates))
+        
+        with self.__stage('snapshot.frame') as stage:
+            df = pd.DataFrame({field_spec.long_name: columns[field_spec.long_name] for field_spec in field_specs}, index=index)
+            stage.rows = len(df)
+        
+        return df
+    
+    
+    def __get_price_snapshots(self, tickers, field_specs, dates, params):
+        """
+            The function returns the pricing and market data of the snapshots as dictionary of field -> values
+            of the (date, ticker) pairs, read from the price store with one binary search (see PriceStore.as_of).
+            
+            Param:
+            adj -> String [y/n] = y (pricing data only)
+            fill_limit -> Int = -1 (no limit)
+        """
+        
+        data_set = field_specs[0].data_set
+        store = self.__get_price_store(data_set)
+        
+        adj = self.__get_param_value(params, 'adj', 'y')
+        fill_limit = int(self.__get_param_value(params, 'fill_limit', -1))
         
-        func = func_dict[field_dict['func']]
+        columns = {}
         
-        return func(tickers, field_dict, **kwargs)
-        
\ No newline at end of file
+        for field_spec in field_specs:
+            col = field_spec.long_name
+            
+            if adj == 'y' and field_spec.func == 'get_pricing_data':
+                columns[col] = self.__get_adjusted_values(data_set, col, slice(None))
+            else:
+                columns[col] = store.column(col)
+        
+        q_tickers = np.tile(np.asarray(tickers, dtype=object), len(dates))
+        q_dates = np.repeat(dates, len(tickers))
+        
+        result = {}
+        
+        for col, (values, obs_dates) in store.as_of(q_tickers, q_dates, columns).items():
+            if fill_limit != -1:
+                values[(q_dates - obs_dates) > np.timedelta64(fill_limit, 'D')] = np.NaN
+            
+            result[col] = values
+        
+        return result
+    
+    
+    def __get_fundamental_snapshots(self, tickers, field_specs, dates, params):
+        """
+            The function returns the fundamental data of the snapshots as dictionary of field -> values
+            of the (date, ticker) pairs. All dates are evaluated as as of dates in one pass by the point in time engine.
+            
+            Param:
+            Period Type: pt -> String [q/a/ttm] = ttm
+            Offset Period: offset_start = offset_end -> Int = 0 (the latest report)
+        """
+        
+        data_set_dict = {d.split('-')[1]: d for d in field_specs[0].data_set.split('/')}
+        field_long_names = [field_spec.long_name for field_spec in field_specs]
+        
+        pt = self.__get_param_value(params, 'pt', 'ttm')
+        offset_start = self.__get_param_value(params, 'offset_start', 0)
+        offset_end = self.__get_param_value(params, 'offset_end', offset_start)
+        
+        if pt not in ('q', 'a', 'ttm'):
+            raise Exception('Err: pt= must be q, a or ttm.')
+        
+        if offset_start != offset_end:
+            raise Exception('Err: Snapshots take one offset period (offset_start = offset_end).')
+        
+        if any(name in params for name in ('y_start', 'y_end', 'q_start', 'q_end', 'as_of_date_start', 'as_of_date_end')):
+            raise Exception('Err: Snapshots only support offset periods, the as of dates are the snapshot dates.')
+        
+        data_set_name = data_set_dict[{'q': 'quarterly', 'a': 'annual', 'ttm': 'ttm'}[pt]]
+        
+        with self.__stage('fundamental.point_in_time') as stage:
+            df = self.__fundamental_point_in_time(data_set_name, tickers, field_long_names, offset_start, offset_end, dates)
+            stage.rows = len(df)
+        
+        # one report per (as of date, ticker), placed at its position in the snapshots
+        date_pos = np.searchsorted(dates, df['As of Date'].values)
+        ticker_pos = pd.Index(tickers).get_indexer(df['Ticker'])
+        
+        take = np.full(len(dates) * len(tickers), -1, dtype=np.int64)
+        take[date_pos * len(tickers) + ticker_pos] = np.arange(len(df))
+        
+        return {col: pd.api.extensions.take(df[col].values, take, allow_fill=True) for col in field_long_names}
+    
+    
+    # the functions reading each group of fields; the pricing and market fields are read together
+    __func_group = {
+        'get_description_data': 'get_description_data',
+        'get_pricing_data': 'get_pricing_data',
+        'get_market_data': 'get_pricing_data',
+        'get_fundamental_data': 'get_fundamental_data',
+    }
+    
+    __func_dict = {
+        'get_description_data': __get_description_data,
+        'get_pricing_data': __get_price_data,
+        'get_fundamental_data': __get_fundamental_data,
+    }
+
+
+class AsyncFinancialDataAPI:
+    """
+        The asyncio client of FinancialDataAPI, e.g. for a web service. The queries run on a bounded pool
+        of max_workers, so the event loop is never blocked and at most max_workers queries run at the same time.
+        The identical queries in flight at the same time are run once, the callers share the result
+        and each one gets its own copy. The queries are identical if their normalized requests and data generations
+        are the same (see FinancialDataAPI.get_request_key), so a query arriving after a reload is not joined
+        with one started before it.
+        With processes=True, the queries run in a pool of worker processes attached to a shared store
+        (see FinancialDataAPI.publish_shared), so a service uses all its cores.
+        The worker processes switch to a new published generation on their next query. Each worker numbers
+        the generations it attaches on its own, so the queries are not joined in this mode.
+        After the csv files are updated, the first query reading a changed data set refreshes the data sets
+        (see refresh_on_change), so the queries keep working before refresh_data_sets is called.
+    """
+    
+    __worker_api = None # the FinancialDataAPI of a worker process
+    
+    def __init__(self, api=None, max_workers=None, shared=None, processes=False, **kwargs):
+        """
+            api: the FinancialDataAPI the queries run on (threads only), by default one is created with shared and kwargs
+            max_workers: the number of queries run at the same time, the number of cpus by default
+            shared: folder of a shared store (see FinancialDataAPI.publish_shared), required with processes=True
+            processes: if True, the queries run in max_workers worker processes instead of threads
+            kwargs: the arguments of FinancialDataAPI, e.g. source
+        """
+        
+        max_workers = max_workers or os.cpu_count() or 1
+        
+        if processes:
+            if shared is None:
+                raise Exception('Err: The worker processes attach a shared store, shared= must be given.')
+            
+            self.__api = None
+            self.__executor = ProcessPoolExecutor(max_workers, initializer=AsyncFinancialDataAPI.worker_init, initargs=(shared,))
+        else:
+            self.__api = api if api is not None else FinancialDataAPI(shared=shared, **kwargs)
+            self.__executor = ThreadPoolExecutor(max_workers, thread_name_prefix='FinancialDataAPI')
+        
+        self.__in_flight = {}
+        self.__calls = 0
+        self.__coalesced = 0
+    
+    
+    @staticmethod
+    def worker_init(shared):
+        """
+            The function attaches a worker process to the shared store, it is run once by each worker process.
+        """
+        
+        AsyncFinancialDataAPI.__worker_api = FinancialDataAPI(shared=shared)
+    
+    
+    @staticmethod
+    def worker_call(name, args, kwargs):
+        """
+            The function runs one query in a worker process.
+        """
+        
+        return getattr(AsyncFinancialDataAPI.__worker_api, name)(*args, **kwargs)
+    
+    
+    async def __call(self, name, *args, **kwargs):
+        """
+            The function runs the query name(*args, **kwargs) on the pool, or joins the identical query in flight.
+            The result is copied for each caller if the query was shared.
+        """
+        
+        loop = asyncio.get_running_loop()
+        self.__calls += 1
+        
+        if self.__api is None:
+            return await loop.run_in_executor(self.__executor, AsyncFinancialDataAPI.worker_call, name, args, kwargs)
+        
+        # the key is taken off the event loop, as it may attach a new generation of a shared store from the drive;
+        # it runs on the default executor, so it doesn't wait for the queries filling the pool
+        key = await loop.run_in_executor(None, functools.partial(self.__api.get_request_key, name, *args, **kwargs))
+        entry = self.__in_flight.get(key)
+        
+        # a query already done is not joined, so all its callers are counted when they get the result
+        if entry is None or entry[0].done():
+            future = loop.run_in_executor(self.__executor, functools.partial(getattr(self.__api, name), *args, **kwargs))
+            
+            # [future, number of callers]; the entry is removed when the query is done, the later calls run it again
+            entry = self.__in_flight[key] = [future, 0]
+            future.add_done_callback(functools.partial(self.__remove_in_flight, key))
+        else:
+            self.__coalesced += 1
+        
+        entry[1] += 1
+        
+        # a cancelled caller doesn't cancel the query of the others
+        result = await asyncio.shield(entry[0])
+        
+        return ResultCache.copy_of(result) if entry[1] > 1 else result
+    
+    
+    def __remove_in_flight(self, key, future):
+        """
+            The function removes the entry of a query when it is done. The callback runs after the query is done,
+            so a new identical query may have replaced the entry in the meantime, its entry is kept.
+        """
+        
+        entry = self.__in_flight.get(key)
+        
+        if entry is not None and entry[0] is future:
+            del self.__in_flight[key]
+    
+    
+    async def __run(self, name, *args, **kwargs):
+        """
+            The function runs name(*args, **kwargs) on the thread pool without joining, e.g. a reload.
+        """
+        
+        if self.__api is None:
+            raise Exception('Err: The worker processes read the shared store, publish the new data with publish_shared.')
+        
+        loop = asyncio.get_running_loop()
+        
+        return await loop.run_in_executor(self.__executor, functools.partial(getattr(self.__api, name), *args, **kwargs))
+    
+    
+    async def get_data(self, tickers, field, **kwargs):
+        """
+            See FinancialDataAPI.get_data.
+        """
+        
+        return await self.__call('get_data', tickers, field, **kwargs)
+    
+    
+    async def get_snapshots(self, tickers, field, dates, **kwargs):
+        """
+            See FinancialDataAPI.get_snapshots.
+        """
+        
+        return await self.__call('get_snapshots', tickers, field, dates, **kwargs)
+    
+    
+    async def get_all_tickers(self, as_of_date=None):
+        """
+            See FinancialDataAPI.get_all_tickers, the as of date is today by default.
+        """
+        
+        return await self.__call('get_all_tickers', as_of_date or date.today())
+    
+    
+    async def get_universe_history(self, dates):
+        """
+            See FinancialDataAPI.get_universe_history.
+        """
+        
+        return await self.__call('get_universe_history', dates)
+    
+    
+    async def get_ticker_by_classification(self, in_, level='Sector', as_of_date=None):
+        """
+            See FinancialDataAPI.get_ticker_by_classification, the as of date is today by default.
+        """
+        
+        return await self.__call('get_ticker_by_classification', in_, level, as_of_date or date.today())
+    
+    
+    async def get_classification(self, level='Sector'):
+        """
+            See FinancialDataAPI.get_classification.
+        """
+        
+        return await self.__call('get_classification', level)
+    
+    
+    async def reload_data_sets_and_meta(self, **kwargs):
+        """
+            See FinancialDataAPI.reload_data_sets_and_meta. The queries keep running during the reload,
+            the ones started before the new data is published return the former data.
+        """
+        
+        return await self.__run('reload_data_sets_and_meta', **kwargs)
+    
+    
+    async def refresh_data_sets(self):
+        """
+            See FinancialDataAPI.refresh_data_sets. The queries keep running during the refresh.
+        """
+        
+        return await self.__run('refresh_data_sets')
+    
+    
+    def get_stats(self):
+        """
+            The function returns the number of calls, the calls joined with an identical query in flight
+            and the queries in flight as dictionary.
+        """
+        
+        return {'calls': self.__calls, 'coalesced': self.__coalesced, 'in_flight': len(self.__in_flight)}
+    
+    
+    async def close(self):
+        """
+            The function waits for the queries in flight and stops the pool.
+        """
+        
+        await asyncio.get_running_loop().run_in_executor(None, self.__executor.shutdown)
+    
+    
+    async def __aenter__(self):
+        return self
+    
+    
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
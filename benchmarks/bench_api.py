@@ -0,0 +1,186 @@
+"""
+    Benchmark of FinancialDataAPI on synthetic bulk data (see synthetic_data.py) at several universe sizes.
+    For each size it times the cold load of the csv files and of the columnar cache, get_all_tickers,
+    the description, pricing, market and derived field queries and each fundamental mode (offset, as of date range,
+    absolute quarterly/ttm and annual periods), and records the peak memory allocated by each case.
+
+    Every case is run repeat times: the first run includes the indexes built on first use, min and median
+    are over all runs. The peak memory is measured with tracemalloc in one extra run, so it doesn't slow the timings.
+    The report is written as json, one record per size and case.
+
+    Usage: python benchmarks/bench_api.py [--sizes 100 500 2000] [--years 5] [--restate 0.1] [--repeat 3] [--out bench_api.json]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from datetime import date, datetime
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from FinancialDataAPI import FinancialDataAPI
+from synthetic_data import generate
+
+
+def num_rows(result):
+    return len(result) if result is not None else None
+
+
+def measure(func, repeat):
+    """
+        The function runs func repeat times, then once more under tracemalloc.
+        The return is a dictionary of the timings, the peak memory and the number of rows of the result.
+    """
+
+    seconds = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        seconds.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'rows': num_rows(result),
+        'first_seconds': seconds[0],
+        'min_seconds': min(seconds),
+        'median_seconds': float(np.median(seconds)),
+        'peak_bytes': peak,
+    }
+
+
+def load_cases(api, source):
+    """
+        The function returns the cold load cases: every data set is read, from the csv files or from the columnar cache.
+    """
+
+    def load(use_cache):
+        api.reload_data_sets_and_meta(source, use_cache=use_cache)
+        api.preload()
+
+    # build the columnar cache once, the cache case then only reads it
+    load(True)
+
+    return {
+        'load_csv': lambda: load(False),
+        'load_cache': lambda: load(True),
+    }
+
+
+def query_cases(api, start_year, years):
+    """
+        The function returns the query cases on the whole universe for the last year of data.
+    """
+
+    last_year = start_year + years - 1
+    as_of_date = date(last_year, 12, 31)
+    as_of = dict(as_of_date_start=as_of_date, as_of_date_end=as_of_date)
+    start, end = '{}-01-01'.format(last_year), '{}-12-31'.format(last_year)
+
+    tickers = api.get_data_set('companies')['Ticker'].tolist()
+
+    return {
+        'get_all_tickers': lambda: api.get_all_tickers(as_of_date),
+        'description': lambda: api.get_data(tickers, ['Company Name', 'Sector', 'Industry']),
+        'pricing': lambda: api.get_data(tickers, 'Close', start=start, end=end, adj='n'),
+        'pricing_adj': lambda: api.get_data(tickers, 'Close', start=start, end=end, adj='y'),
+        'pricing_fill_prev': lambda: api.get_data(tickers, 'Close', start=start, end=end, adj='n', fill_prev='y'),
+        'pricing_adj_fill_prev': lambda: api.get_data(tickers, ['Open', 'Close'], start=start, end=end, adj='y', fill_prev='y'),
+        'market': lambda: api.get_data(tickers, ['Volume', 'Dividend'], start=start, end=end),
+        'derived': lambda: api.get_data(tickers, ['Turnover', 'Market Capitalization', 'Daily Return'], start=start, end=end),
+        'fundamental_offset': lambda: api.get_data(tickers, 'Revenue', pt='q', offset_start=-3, offset_end=0, **as_of),
+        'fundamental_as_of_range': lambda: api.get_data(
+            tickers, 'Revenue', pt='ttm', as_of_date_start=date(last_year, 10, 1), as_of_date_end=as_of_date
+        ),
+        'fundamental_absolute_q': lambda: api.get_data(
+            tickers, 'Revenue', pt='q', y_start=last_year - 1, q_start=1, y_end=last_year - 1, q_end=4, **as_of
+        ),
+        'fundamental_absolute_ttm': lambda: api.get_data(
+            tickers, 'Revenue', pt='ttm', y_start=last_year - 1, q_start=1, y_end=last_year - 1, q_end=4, **as_of
+        ),
+        'fundamental_annual': lambda: api.get_data(
+            tickers, 'Revenue', pt='a', y_start=last_year - 2, y_end=last_year - 1, **as_of
+        ),
+    }
+
+
+def run(sizes, years, restate, repeat, seed, start_year=2015):
+    records = []
+    work_dir = tempfile.mkdtemp(prefix='bench_api_')
+    api = None
+
+    try:
+        for size in sizes:
+            source = os.path.join(work_dir, str(size))
+            file_rows = generate(source, size, years, restate, seed, start_year)
+
+            if api is None:
+                api = FinancialDataAPI(source)
+
+            cases = load_cases(api, source)
+            cases.update(query_cases(api, start_year, years))
+
+            for case, func in cases.items():
+                record = dict(size=size, case=case, **measure(func, repeat))
+                records.append(record)
+
+                rows = '-' if record['rows'] is None else '{:,}'.format(record['rows'])
+
+                print('{:>6} {:26} {:>10} rows {:9.4f} s {:9.4f} s {:10.1f} MB'.format(
+                    size, case, rows, record['first_seconds'], record['min_seconds'], record['peak_bytes'] / 1024 ** 2
+                ))
+
+            records.append({'size': size, 'case': 'files', 'file_rows': file_rows})
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return records
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark FinancialDataAPI on synthetic data.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 500, 2000], help='numbers of tickers')
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--restate', type=float, default=0.1)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='bench_api.json')
+    args = parser.parse_args()
+    out = os.path.abspath(args.out)
+
+    # the meta file is read from ./meta
+    os.chdir(ROOT)
+
+    print('{:>6} {:26} {:>15} {:>11} {:>11} {:>13}'.format('size', 'case', 'rows', 'first', 'min', 'peak'))
+
+    records = run(args.sizes, args.years, args.restate, args.repeat, args.seed)
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'params': vars(args),
+        'results': records,
+    }
+
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print('report: {}'.format(out))
@@ -0,0 +1,65 @@
+"""
+    Benchmark of the ticker reordering used by every get_data path.
+    It compares the former per row tickers.index(x) lookup with the vectorized ticker -> position index
+    on a long frame of num_tickers x num_days rows, like a full universe daily price request.
+    
+    Usage: python benchmarks/bench_ticker_order.py [num_tickers] [num_days]
+"""
+
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+
+def make_frame(num_tickers, num_days):
+    tickers = ['T{:05d}'.format(i) for i in range(num_tickers)]
+    dates = pd.date_range('2018-01-01', periods=num_days).values
+    
+    df = pd.DataFrame({
+        'Ticker': np.repeat(tickers, num_days),
+        'Date': np.tile(dates, num_tickers),
+        'Close': np.random.default_rng(0).random(num_tickers * num_days),
+    })
+    
+    # request the tickers in a different order than the frame
+    return df, tickers[::-1]
+
+
+def order_by_list_index(df, tickers):
+    df = df.copy()
+    df['Ticker Order'] = df['Ticker'].apply(lambda x: tickers.index(x))
+    df = df.sort_values(['Ticker Order', 'Date'])
+    del df['Ticker Order']
+    return df.set_index('Ticker')
+
+
+def order_by_position_index(df, tickers):
+    df = df.copy()
+    df['Ticker Order'] = pd.Index(tickers).get_indexer(df['Ticker'])
+    df = df.sort_values(['Ticker Order', 'Date'])
+    del df['Ticker Order']
+    return df.set_index('Ticker')
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+if __name__ == '__main__':
+    num_tickers = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    num_days = int(sys.argv[2]) if len(sys.argv) > 2 else 365
+    
+    df, tickers = make_frame(num_tickers, num_days)
+    
+    t_vectorized, r_vectorized = timed(order_by_position_index, df, tickers)
+    t_list_index, r_list_index = timed(order_by_list_index, df, tickers)
+    
+    pd.testing.assert_frame_equal(r_vectorized, r_list_index)
+    
+    print('rows: {:,} ({} tickers x {} days)'.format(len(df), num_tickers, num_days))
+    print('tickers.index(x) per row: {:8.3f} s'.format(t_list_index))
+    print('ticker -> position index: {:8.3f} s'.format(t_vectorized))
+    print('speed up: {:.0f}x'.format(t_list_index / t_vectorized))
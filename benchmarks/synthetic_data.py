@@ -0,0 +1,216 @@
+"""
+    Synthetic SimFin bulk data for the benchmarks, so FinancialDataAPI can be exercised without the real files.
+    It writes the csv files of a ./data folder (companies, industries, daily share prices and the quarterly,
+    annual and ttm balance, income and cashflow statements) with the columns implied by meta/fields-meta.csv.
+
+    The data has the irregularities of the real files: late listings and delistings, missing days,
+    companies without prices or statements, missing closes, 2:1 splits, dividends,
+    June and December fiscal years and restated reports published again later.
+
+    Usage: python benchmarks/synthetic_data.py out_dir [--tickers 500] [--years 5] [--restate 0.1] [--seed 0]
+"""
+
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+
+META_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'meta', 'fields-meta.csv')
+
+INDUSTRIES = pd.DataFrame({
+    'IndustryId': [100001, 100002, 101001, 101002, 102001, 103001, 104001],
+    'Sector': ['Industrials', 'Industrials', 'Technology', 'Technology', 'Energy', 'Healthcare', 'Consumer Cyclical'],
+    'Industry': ['Airlines', 'Machinery', 'Software', 'Semiconductors', 'Oil & Gas', 'Biotechnology', 'Retail'],
+})
+
+STATEMENTS = ['balance', 'income', 'cashflow']
+PERIOD_TYPES = ['quarterly', 'annual', 'ttm']
+
+
+def make_tickers(rng, num_tickers):
+    """
+        The function returns num_tickers unique tickers of 1 to 5 letters.
+        The tickers read back as NaN by pandas (e.g. NA, NAN) are left out.
+    """
+
+    letters = np.array(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ'))
+    na_values = {'NA', 'NAN', 'NULL'}
+    tickers = []
+
+    while len(tickers) < num_tickers:
+        lengths = rng.integers(1, 6, num_tickers * 2)
+        candidates = [''.join(rng.choice(letters, n)) for n in lengths]
+        tickers = list(dict.fromkeys(tickers + [ticker for ticker in candidates if ticker not in na_values]))
+
+    return tickers[:num_tickers]
+
+
+def make_companies(rng, tickers):
+    """
+        The function returns the companies data set, 5% of the companies have no industry.
+    """
+
+    num_tickers = len(tickers)
+
+    companies = pd.DataFrame({
+        'Ticker': tickers,
+        'SimFinId': rng.permutation(np.arange(1000, 1000 + num_tickers * 7, 7)),
+        'Company Name': [ticker + ' Corp' for ticker in tickers],
+        'IndustryId': rng.choice(INDUSTRIES['IndustryId'].values, num_tickers).astype(float),
+    })
+
+    companies.loc[rng.random(num_tickers) < 0.05, 'IndustryId'] = np.NaN
+
+    return companies
+
+
+def make_share_prices(rng, companies, start_year, years):
+    """
+        The function returns the daily share prices on business days, sorted by ticker and date.
+        The Adj. Close is the Close adjusted for the 2:1 split of 20% of the tickers and for the dividends.
+    """
+
+    days = pd.bdate_range('{}-01-01'.format(start_year), '{}-12-31'.format(start_year + years - 1))
+    num_tickers, num_days = len(companies), len(days)
+    day_pos = np.arange(num_days)
+
+    # the price is a random walk, unadjusted it is twice as high before a split
+    price = 50 * np.exp(np.cumsum(rng.normal(0, 0.02, (num_tickers, num_days)), axis=1))
+    split_day = np.where(rng.random(num_tickers) < 0.2, rng.integers(1, num_days, num_tickers), 0)
+    split = np.where(day_pos < split_day[:, None], 2.0, 1.0)
+    close = price * split
+
+    dividend = np.where(rng.random((num_tickers, num_days)) < 0.01, np.round(rng.random((num_tickers, num_days)), 2), np.NaN)
+
+    # the prices before a dividend are adjusted by 1 - dividend / close
+    ratio = np.where(np.isnan(dividend), 1.0, 1 - np.nan_to_num(dividend) / close)
+    later = np.cumprod(ratio[:, ::-1], axis=1)[:, ::-1]
+    dividend_factor = np.concatenate([later[:, 1:], np.ones((num_tickers, 1))], axis=1)
+
+    # listing window: 10% list late, 10% are delisted, 3% have no prices, 2% of the days are missing
+    first = np.where(rng.random(num_tickers) < 0.1, rng.integers(0, num_days // 2, num_tickers), 0)
+    last = np.where(rng.random(num_tickers) < 0.1, rng.integers(num_days // 2, num_days, num_tickers), num_days)
+    keep = (day_pos >= first[:, None]) & (day_pos < last[:, None]) & (rng.random((num_tickers, num_days)) > 0.02)
+    keep[rng.random(num_tickers) < 0.03] = False
+
+    ticker_pos, date_pos = np.nonzero(keep)
+    num_rows = len(ticker_pos)
+
+    close = close[keep]
+    open_ = close * (1 + rng.normal(0, 0.01, num_rows))
+    missing_close = rng.random(num_rows) < 0.001
+
+    return pd.DataFrame({
+        'Ticker': companies['Ticker'].values[ticker_pos],
+        'SimFinId': companies['SimFinId'].values[ticker_pos],
+        'Date': days[date_pos].strftime('%Y-%m-%d'),
+        'Open': np.round(open_, 2),
+        'Low': np.round(np.minimum(open_, close) * 0.99, 2),
+        'High': np.round(np.maximum(open_, close) * 1.01, 2),
+        'Close': np.where(missing_close, np.NaN, np.round(close, 2)),
+        'Adj. Close': np.round(close * (dividend_factor / split)[keep], 2),
+        'Dividend': dividend[keep],
+        'Volume': rng.integers(1000, 10 ** 7, num_rows),
+        'Shares Outstanding': 1e8 * (3 - split[keep]),
+    })
+
+
+def make_statement(rng, companies, fields, extra, period_type, start_year, years, restate):
+    """
+        The function returns one statement for a period type (quarterly, annual or ttm).
+        The fiscal year ends in June for 25% of the companies and in December for the others.
+        Each report is published 20 to 60 days after its report date, and a fraction restate of the reports
+        is published again 30 to 200 days later with restated values.
+    """
+
+    # 3% of the companies have no statements
+    companies = companies[rng.random(len(companies)) >= 0.03]
+
+    fiscal_years = np.arange(start_year - 2, start_year + years)
+    quarters = [4] if period_type == 'annual' else [1, 2, 3, 4]
+
+    fy_end_month = np.where(rng.random(len(companies)) < 0.25, 6, 12)
+
+    company_pos = np.repeat(np.arange(len(companies)), len(fiscal_years) * len(quarters))
+    fiscal_year = np.tile(np.repeat(fiscal_years, len(quarters)), len(companies))
+    quarter = np.tile(quarters, len(companies) * len(fiscal_years))
+
+    # the last month of the quarter, counted in months since year 0
+    month = fiscal_year * 12 + fy_end_month[company_pos] - 1 - 3 * (4 - quarter)
+    report = pd.to_datetime(pd.DataFrame({'year': month // 12, 'month': month % 12 + 1, 'day': 1})) + pd.offsets.MonthEnd(0)
+    publish = report + pd.to_timedelta(rng.integers(20, 60, len(report)), unit='D')
+
+    values = np.round(rng.normal(1e6, 3e5, (len(report), len(extra) + len(fields))))
+
+    df = pd.DataFrame({
+        'Ticker': companies['Ticker'].values[company_pos],
+        'SimFinId': companies['SimFinId'].values[company_pos],
+        'Currency': 'USD',
+        'Fiscal Year': fiscal_year,
+        'Fiscal Period': np.where(period_type == 'annual', 'FY', np.char.add('Q', quarter.astype(str))),
+        'Report Date': report.values,
+        'Publish Date': publish.values,
+        'Restated Date': publish.values,
+        'Shares (Basic)': 1e8,
+        'Shares (Diluted)': 1.1e8,
+    })
+
+    df = pd.concat([df, pd.DataFrame(values, columns=extra + fields)], axis=1)
+
+    restated = df[rng.random(len(df)) < restate].copy()
+    restated['Publish Date'] = restated['Publish Date'] + pd.to_timedelta(rng.integers(30, 200, len(restated)), unit='D')
+    restated['Restated Date'] = restated['Publish Date']
+    restated[extra + fields] = restated[extra + fields] * 1.05
+
+    df = pd.concat([df, restated], ignore_index=True)
+
+    return df.sort_values(['SimFinId', 'Report Date', 'Publish Date'], kind='stable')
+
+
+def generate(out_dir, num_tickers=500, years=5, restate=0.1, seed=0, start_year=2015):
+    """
+        The function writes the synthetic bulk csv files into out_dir and returns the number of rows of each file.
+    """
+
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+
+    meta = pd.read_csv(META_PATH)
+
+    tickers = make_tickers(rng, num_tickers)
+    companies = make_companies(rng, tickers)
+
+    files = {
+        'industries.csv': INDUSTRIES,
+        'us-companies.csv': companies,
+        'us-shareprices-daily.csv': make_share_prices(rng, companies, start_year, years),
+    }
+
+    for statement in STATEMENTS:
+        fields = meta[meta['data_set'].str.startswith(statement + '-')]['Long Name'].tolist()
+        fields = [field for field in fields if field not in ('Shares (Basic)', 'Shares (Diluted)')]
+        extra = ['Net Income/Starting Line'] if statement == 'cashflow' else []
+
+        for period_type in PERIOD_TYPES:
+            files['us-{}-{}.csv'.format(statement, period_type)] = make_statement(
+                rng, companies, fields, extra, period_type, start_year, years, restate
+            )
+
+    for file_name, df in files.items():
+        df.to_csv(os.path.join(out_dir, file_name), sep=';', index=False, date_format='%Y-%m-%d')
+
+    return {file_name: len(df) for file_name, df in files.items()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write synthetic SimFin bulk csv files.')
+    parser.add_argument('out_dir')
+    parser.add_argument('--tickers', type=int, default=500)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--restate', type=float, default=0.1, help='fraction of the reports published again restated')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for file_name, num_rows in generate(args.out_dir, args.tickers, args.years, args.restate, args.seed).items():
+        print('{:32} {:>10,} rows'.format(file_name, num_rows))
@@ -0,0 +1,741 @@
+"""
+    Tests of FinancialDataAPI on a small synthetic data set (see benchmarks/synthetic_data.py).
+    Every query category is checked against a reference computed with plain pandas from the csv files.
+
+    Usage: python -m pytest -q tests
+"""
+
+import os
+import sys
+import shutil
+import time
+import asyncio
+import threading
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from FinancialDataAPI import FinancialDataAPI, AsyncFinancialDataAPI, DataSetRegistry, DataSetChangedError, ResultCache
+from synthetic_data import generate
+
+START_YEAR = 2016
+YEARS = 3
+NUM_TICKERS = 20
+
+
+def read_csv(source, file_name):
+    df = pd.read_csv(os.path.join(source, file_name), sep=';')
+
+    for col in ['Date', 'Report Date', 'Publish Date', 'Restated Date']:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col])
+
+    return df
+
+
+def known_reports(statement, as_of_date):
+    """
+        The reference point in time view: the latest publication of each report published on or before as_of_date,
+        sorted by Ticker and Report Date.
+    """
+
+    df = statement[statement['Publish Date'] <= pd.Timestamp(as_of_date)]
+    df = df.sort_values(['Ticker', 'Report Date', 'Publish Date'], kind='stable')
+
+    return df.groupby(['Ticker', 'Report Date'], sort=False).tail(1)
+
+
+def offset_reports(statement, tickers, as_of_date, offset_start, offset_end):
+    """
+        The reference offset periods: the reports offset_start..offset_end counted back from the latest known report.
+    """
+
+    df = known_reports(statement, as_of_date)
+    parts = []
+
+    for ticker in tickers:
+        reports = df[df['Ticker'] == ticker]
+        parts.append(reports.iloc[len(reports) + offset_start - 1:len(reports) + offset_end])
+
+    return with_missing_tickers(pd.concat(parts), tickers)
+
+
+def with_missing_tickers(df, tickers):
+    """
+        The reference adds one row of NaN for each ticker without data and orders the rows by the tickers.
+    """
+
+    missing = [ticker for ticker in tickers if ticker not in set(df['Ticker'])]
+    df = pd.concat([df, pd.DataFrame({'Ticker': missing})], ignore_index=True)
+    order = df['Ticker'].map({ticker: i for i, ticker in enumerate(tickers)})
+
+    return df.iloc[np.argsort(order.values, kind='stable')]
+
+
+def assert_same(actual, expected):
+    assert pd.Index(actual).equals(pd.Index(expected))
+
+
+@pytest.fixture(scope='module')
+def source(tmp_path_factory):
+    source = str(tmp_path_factory.mktemp('data'))
+    generate(source, NUM_TICKERS, YEARS, restate=0.2, seed=1, start_year=START_YEAR)
+
+    return source
+
+
+@pytest.fixture
+def api(source, monkeypatch):
+    # the meta files are read from ./meta
+    monkeypatch.chdir(ROOT)
+
+    api = FinancialDataAPI(source)
+    api.reload_data_sets_and_meta(source)
+
+    return api
+
+
+@pytest.fixture(scope='module')
+def prices(source):
+    return read_csv(source, 'us-shareprices-daily.csv')
+
+
+@pytest.fixture(scope='module')
+def tickers(prices):
+    return sorted(prices['Ticker'].unique().tolist())[:8]
+
+
+def assert_values(actual, expected):
+    np.testing.assert_allclose(np.asarray(actual, dtype=float), np.asarray(expected, dtype=float), rtol=1e-6, equal_nan=True)
+
+
+def price_pivot(prices, field, tickers, start, end, fill_prev):
+    """
+        The reference (date x ticker) frame of a price field on every calendar day between start and end.
+        With fill_prev the last price before start is carried into the range.
+    """
+
+    pivot = prices.pivot(index='Date', columns='Ticker', values=field).reindex(columns=tickers)
+
+    if fill_prev:
+        days = pd.date_range(min(pivot.index.min(), pd.Timestamp(start)), end)
+        return pivot.reindex(days).ffill().loc[start:end]
+
+    return pivot.reindex(pd.date_range(start, end))
+
+
+def long_to_pivot(df, field):
+    return df.reset_index().pivot(index='Date', columns='Ticker', values=field)
+
+
+def test_description(api, source, tickers):
+    companies = read_csv(source, 'us-companies.csv')
+    industries = read_csv(source, 'industries.csv')
+    expected = companies.merge(industries, on='IndustryId', how='left').set_index('Ticker').loc[tickers]
+
+    df = api.get_data(tickers, ['Company Name', 'Sector'])
+
+    assert df.index.tolist() == tickers
+    assert df.columns.tolist() == ['Company Name', 'Sector']
+    assert df['Company Name'].tolist() == expected['Company Name'].tolist()
+    assert df['Sector'].tolist() == expected['Sector'].tolist()
+
+
+def test_unknown_ticker_has_nan_row(api, tickers):
+    df = api.get_data(tickers + ['NOSUCH'], 'Company Name')
+
+    assert df.index.tolist() == tickers + ['NOSUCH']
+    assert pd.isna(df.loc['NOSUCH', 'Company Name'])
+
+
+@pytest.mark.parametrize('fill_prev', ['n', 'y'])
+def test_prices_unadjusted(api, prices, tickers, fill_prev):
+    start, end = '{}-03-01'.format(START_YEAR + 1), '{}-05-31'.format(START_YEAR + 1)
+
+    df = api.get_data(tickers, ['Close', 'Volume'], start=start, end=end, adj='n', fill_prev=fill_prev)
+
+    assert df.columns.tolist() == ['Date', 'Close', 'Volume']
+
+    for field in ['Close', 'Volume']:
+        expected = price_pivot(prices, field, tickers, start, end, fill_prev == 'y')
+        actual = long_to_pivot(df, field).reindex(index=expected.index, columns=tickers)
+        assert_values(actual, expected)
+
+
+def test_prices_adjusted(api, prices, tickers):
+    start, end = '{}-01-01'.format(START_YEAR), '{}-12-31'.format(START_YEAR)
+
+    df = api.get_data(tickers, 'Close', start=start, end=end, adj='y')
+
+    expected = price_pivot(prices, 'Adj. Close', tickers, start, end, False)
+    valid = price_pivot(prices, 'Close', tickers, start, end, False).notna()
+    actual = long_to_pivot(df, 'Close').reindex(index=expected.index, columns=tickers)
+
+    assert_values(actual[valid], expected[valid])
+
+
+@pytest.mark.parametrize('price_cache', [False, True])
+def test_prices_adjusted_across_a_split(api, prices, price_cache):
+    # the ticker with the largest jump of Adj. Close / Close from one day to the next has a 2:1 split there
+    prices = prices.sort_values(['Ticker', 'Date'])
+    factor = prices['Adj. Close'] / prices['Close']
+    jump = factor / factor.groupby(prices['Ticker']).shift(1)
+    split = prices.loc[jump.idxmax()]
+    assert jump.max() > 1.8
+
+    ticker, split_day = split['Ticker'], split['Date']
+    start, end = split_day - pd.Timedelta(days=20), split_day + pd.Timedelta(days=20)
+    fields = ['Open', 'High', 'Low', 'Close']
+
+    if price_cache:
+        api.enable_adjusted_price_cache()
+
+    try:
+        adjusted = api.get_data([ticker], fields, start=start, end=end, adj='y').set_index('Date')
+    finally:
+        api.disable_adjusted_price_cache()
+
+    unadjusted = api.get_data([ticker], fields, start=start, end=end, adj='n').set_index('Date')
+
+    raw = prices[(prices['Ticker'] == ticker) & prices['Date'].between(start, end) & prices['Close'].notna()].set_index('Date')
+    raw_factor = raw['Adj. Close'] / raw['Close']
+
+    assert (raw.index < split_day).any() and (raw.index >= split_day).any()
+
+    for field in fields:
+        assert_values(adjusted.loc[raw.index, field], raw[field] * raw_factor)
+        assert_values(unadjusted.loc[raw.index, field], raw[field])
+
+
+@pytest.mark.parametrize('pt, file_name', [('q', 'us-income-quarterly.csv'), ('ttm', 'us-income-ttm.csv'), ('a', 'us-income-annual.csv')])
+def test_fundamental_offset(api, source, tickers, pt, file_name):
+    statement = read_csv(source, file_name)
+    as_of_date = '{}-08-15'.format(START_YEAR + 1)
+
+    df = api.get_data(tickers, ['Revenue', 'Net Income'], pt=pt, offset_start=-2, offset_end=0, as_of_date_start=as_of_date, as_of_date_end=as_of_date)
+    expected = offset_reports(statement, tickers, as_of_date, -2, 0)
+
+    assert df.index.tolist() == expected['Ticker'].tolist()
+    assert_same(df['Report Date'], expected['Report Date'])
+    assert_values(df[['Revenue', 'Net Income']], expected[['Revenue', 'Net Income']])
+
+
+def test_fundamental_as_of_date_range(api, source, tickers):
+    statement = read_csv(source, 'us-balance-quarterly.csv')
+    start, end = '{}-01-01'.format(START_YEAR + 1), '{}-03-31'.format(START_YEAR + 1)
+
+    df = api.get_data(tickers, 'Total Equity', pt='q', offset_start=-1, offset_end=-1, as_of_date_start=start, as_of_date_end=end)
+
+    assert sorted(df['As of Date'].unique()) == list(pd.date_range(start, end))
+
+    for as_of_date in pd.date_range(start, end, freq='7D'):
+        rows = df[df['As of Date'] == as_of_date]
+        expected = offset_reports(statement, tickers, as_of_date, -1, -1)
+
+        assert rows.index.tolist() == expected['Ticker'].tolist()
+        assert_same(rows['Report Date'], expected['Report Date'])
+        assert_values(rows['Total Equity'], expected['Total Equity'])
+
+
+@pytest.mark.parametrize('pt, file_name', [('q', 'us-cashflow-quarterly.csv'), ('ttm', 'us-cashflow-ttm.csv')])
+def test_fundamental_absolute_q_ttm(api, source, tickers, pt, file_name):
+    statement = read_csv(source, file_name)
+    as_of_date = '{}-12-31'.format(START_YEAR + 2)
+
+    df = api.get_data(
+        tickers, 'Net Cash from Operating Activities',
+        pt=pt, y_start=START_YEAR, q_start=2, y_end=START_YEAR + 1, q_end=3, as_of_date_start=as_of_date, as_of_date_end=as_of_date
+    )
+
+    expected = known_reports(statement, as_of_date)
+    quarter = expected['Fiscal Period'].str[-1:].astype(int)
+    expected = expected[
+        expected['Ticker'].isin(tickers) & expected['Fiscal Year'].between(START_YEAR, START_YEAR + 1) & quarter.between(2, 3)
+    ]
+    expected = with_missing_tickers(expected.sort_values(['Ticker', 'Publish Date'], kind='stable'), tickers)
+
+    assert df.index.tolist() == expected['Ticker'].tolist()
+    assert_same(df['Fiscal Period'], expected['Fiscal Period'])
+    assert_values(df['Net Cash from Operating Activities'], expected['Net Cash from Operating Activities'])
+
+
+def test_fundamental_absolute_a(api, source, tickers):
+    statement = read_csv(source, 'us-balance-annual.csv')
+    as_of_date = '{}-12-31'.format(START_YEAR + 2)
+
+    df = api.get_data(tickers, 'Total Assets', pt='a', y_start=START_YEAR, y_end=START_YEAR + 1, as_of_date_start=as_of_date, as_of_date_end=as_of_date)
+
+    expected = known_reports(statement, as_of_date)
+    expected = expected[expected['Ticker'].isin(tickers) & expected['Fiscal Year'].between(START_YEAR, START_YEAR + 1)]
+    expected = with_missing_tickers(expected.sort_values(['Ticker', 'Publish Date'], kind='stable'), tickers)
+
+    assert df.index.tolist() == expected['Ticker'].tolist()
+    assert_same(df['Fiscal Year'], expected['Fiscal Year'])
+    assert_values(df['Total Assets'], expected['Total Assets'])
+
+
+def test_iter_data_by_ticker(api, tickers):
+    start, end = '{}-01-01'.format(START_YEAR), '{}-06-30'.format(START_YEAR)
+
+    prices = api.get_data(tickers, ['Close', 'Volume'], start=start, end=end, fill_prev='y')
+    chunks = list(api.iter_data(tickers, ['Close', 'Volume'], chunk_size=3, start=start, end=end, fill_prev='y'))
+
+    assert len(chunks) == 3
+    pd.testing.assert_frame_equal(pd.concat(chunks), prices)
+
+    params = dict(pt='q', offset_start=-1, offset_end=0, as_of_date_start='{0}-06-30'.format(START_YEAR + 1), as_of_date_end='{0}-06-30'.format(START_YEAR + 1))
+    fundamentals = api.get_data(tickers, ['Revenue', 'Gross Profit'], **params)
+    chunks = list(api.iter_data(tickers, ['Revenue', 'Gross Profit'], chunk_size=3, **params))
+
+    pd.testing.assert_frame_equal(pd.concat(chunks), fundamentals)
+
+
+def test_iter_data_by_ticker_with_empty_chunk(api, tickers):
+    # the last chunk has no reports in the as of date range
+    chunked = tickers + ['NOSUCH1', 'NOSUCH2']
+    params = dict(pt='q', offset_start=0, offset_end=0, as_of_date_start='{}-01-01'.format(START_YEAR + 1), as_of_date_end='{}-01-31'.format(START_YEAR + 1))
+
+    df = api.get_data(chunked, 'Total Equity', **params)
+    chunks = list(api.iter_data(chunked, 'Total Equity', chunk_size=len(tickers), **params))
+
+    assert chunks[-1]['Total Equity'].isna().all()
+    assert len(chunks[-1]) == 2 * 31
+    pd.testing.assert_frame_equal(pd.concat(chunks), df)
+
+
+def test_iter_data_by_date(api, tickers):
+    start, end = '{}-01-01'.format(START_YEAR), '{}-12-31'.format(START_YEAR + 1)
+
+    df = api.get_data(tickers, 'Close', start=start, end=end, fill_prev='y')
+    chunks = list(api.iter_data(tickers, 'Close', chunk_by='date', chunk_size=100, start=start, end=end, fill_prev='y'))
+
+    assert len(chunks) == 8
+
+    actual = long_to_pivot(pd.concat(chunks), 'Close')
+    expected = long_to_pivot(df, 'Close')
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_snapshots(api, source, prices, tickers):
+    statement = read_csv(source, 'us-income-ttm.csv')
+    dates = pd.to_datetime(['{}-03-31'.format(START_YEAR + 1), '{}-09-30'.format(START_YEAR + 1), '{}-06-30'.format(START_YEAR + 2)])
+
+    df = api.get_snapshots(tickers, ['Close', 'Revenue'], dates)
+
+    assert df.index.names == ['Date', 'Ticker']
+    assert df.index.get_level_values('Date').unique().tolist() == dates.tolist()
+
+    for day in dates:
+        close = price_pivot(prices, 'Adj. Close', tickers, day, day, True).iloc[0]
+        assert_values(df.loc[day, 'Close'].reindex(tickers), close.reindex(tickers))
+
+        revenue = offset_reports(statement, tickers, day, 0, 0).set_index('Ticker')['Revenue']
+        assert_values(df.loc[day, 'Revenue'].reindex(tickers), revenue.reindex(tickers))
+
+
+def test_derived_fields(api, prices, tickers):
+    start, end = '{}-02-01'.format(START_YEAR), '{}-02-29'.format(START_YEAR)
+
+    df = api.get_data(tickers, 'Turnover', start=start, end=end)
+
+    volume = price_pivot(prices, 'Volume', tickers, start, end, False)
+    close = price_pivot(prices, 'Close', tickers, start, end, False)
+    actual = long_to_pivot(df, 'Turnover').reindex(index=volume.index, columns=tickers)
+
+    assert_values(actual, volume * close)
+
+
+def test_derived_fields_keep_request_order(api, tickers):
+    start, end = '{}-02-01'.format(START_YEAR), '{}-02-29'.format(START_YEAR)
+
+    df = api.get_data(tickers, ['Turnover', 'Volume', 'Daily Return', 'Close'], start=start, end=end)
+
+    assert df.columns.tolist() == ['Date', 'Turnover', 'Volume', 'Daily Return', 'Close']
+
+
+def test_lagged_derived_fields_cannot_be_chunked_by_date(api, tickers):
+    start, end = '{}-01-01'.format(START_YEAR), '{}-12-31'.format(START_YEAR)
+
+    with pytest.raises(Exception, match='Daily Return'):
+        next(api.iter_data(tickers, ['Turnover', 'Daily Return'], chunk_by='date', start=start, end=end))
+
+    df = api.get_data(tickers, 'Turnover', start=start, end=end)
+    chunks = list(api.iter_data(tickers, 'Turnover', chunk_by='date', chunk_size=100, start=start, end=end))
+
+    pd.testing.assert_frame_equal(long_to_pivot(pd.concat(chunks), 'Turnover'), long_to_pivot(df, 'Turnover'))
+
+
+def test_refresh_matches_full_reload(api, source, tmp_path, tickers):
+    # the refreshed data set starts without the last year of prices and a few late restatements
+    refreshed = str(tmp_path / 'refreshed')
+    shutil.copytree(source, refreshed)
+
+    price_file = os.path.join(refreshed, 'us-shareprices-daily.csv')
+    statement_file = os.path.join(refreshed, 'us-income-quarterly.csv')
+
+    with open(price_file) as f:
+        price_lines = f.readlines()
+
+    cut = '{}-'.format(START_YEAR + YEARS - 1)
+    head = [line for line in price_lines if cut not in line.split(';')[2]]
+    tail = [line for line in price_lines if cut in line.split(';')[2]]
+
+    with open(price_file, 'w') as f:
+        f.writelines(head)
+
+    statement = read_csv(refreshed, 'us-income-quarterly.csv')
+    statement.drop(index=statement.index[-5:]).to_csv(statement_file, sep=';', index=False, date_format='%Y-%m-%d')
+
+    api.reload_data_sets_and_meta(refreshed)
+
+    start, end = '{}-12-01'.format(START_YEAR + YEARS - 2), '{}-01-31'.format(START_YEAR + YEARS - 1)
+    queries = [
+        (tickers, ['Close', 'Volume'], dict(start=start, end=end, fill_prev='y')),
+        (tickers, 'Revenue', dict(pt='q', offset_start=-1, offset_end=0, as_of_date_start=end, as_of_date_end=end)),
+    ]
+
+    for query in queries:
+        api.get_data(query[0], query[1], **query[2])
+
+    with open(price_file, 'a') as f:
+        f.writelines(tail)
+
+    shutil.copy(os.path.join(source, 'us-income-quarterly.csv'), statement_file)
+
+    generation = api.get_data_generation()
+    status = api.refresh_data_sets()
+
+    assert status['shareprices-daily'] == 'appended'
+    assert status['income-quarterly'] == 'reloaded'
+    assert api.get_data_generation() != generation
+
+    refreshed_results = [api.get_data(query[0], query[1], **query[2]) for query in queries]
+
+    api.reload_data_sets_and_meta(refreshed, use_cache=False)
+
+    for query, refreshed_result in zip(queries, refreshed_results):
+        pd.testing.assert_frame_equal(refreshed_result, api.get_data(query[0], query[1], **query[2]))
+
+
+def test_request_key_is_the_normalized_request(api, tickers):
+    # numpy shortens the repr of the large arrays, the two universes only differ in the middle
+    universe_a = np.array(['X{}'.format(i) for i in range(1000)] + tickers[:4] + ['Y{}'.format(i) for i in range(1000)])
+    universe_b = np.array(['X{}'.format(i) for i in range(1000)] + tickers[4:] + ['Y{}'.format(i) for i in range(1000)])
+
+    assert repr(universe_a) == repr(universe_b)
+    assert api.get_request_key('get_data', universe_a, 'Company Name') != api.get_request_key('get_data', universe_b, 'Company Name')
+
+    # the same request written differently
+    key = api.get_request_key('get_data', tickers, ['Close'], start='2017-01-01', end='2017-01-31')
+    assert api.get_request_key('get_data', [t.lower() for t in tickers], ['close'], END='2017-01-31', start='2017-01-01') == key
+    assert api.get_request_key('get_data', tickers, 'Close', start='2017-01-01', end='2017-01-31') != key
+
+    generation, _ = key
+    assert generation == api.get_data_generation()
+
+
+def test_async_client(api, tickers):
+    universe_a = np.array(['X{}'.format(i) for i in range(1000)] + tickers[:4] + ['Y{}'.format(i) for i in range(1000)])
+    universe_b = np.array(['X{}'.format(i) for i in range(1000)] + tickers[4:] + ['Y{}'.format(i) for i in range(1000)])
+
+    async def run():
+        async with AsyncFinancialDataAPI(api, max_workers=2) as client:
+            results = await asyncio.gather(
+                client.get_data(universe_a, 'Company Name'), client.get_data(universe_b, 'Company Name'),
+                client.get_data(tickers, 'Close', start='2017-01-01', end='2017-01-31'),
+                client.get_data(tickers, 'Close', start='2017-01-01', end='2017-01-31'),
+            )
+
+            return results, client.get_stats()
+
+    results, stats = asyncio.run(run())
+
+    pd.testing.assert_frame_equal(results[0], api.get_data(universe_a, 'Company Name'))
+    pd.testing.assert_frame_equal(results[1], api.get_data(universe_b, 'Company Name'))
+    pd.testing.assert_frame_equal(results[2], results[3])
+    assert results[2] is not results[3]
+    assert stats['calls'] == 4 and stats['coalesced'] <= 1 and stats['in_flight'] == 0
+
+
+class GatedAPI:
+    """
+        A stand-in of FinancialDataAPI for the async client: the n-th get_data call runs when data_gates[n] is set
+        and the n-th get_request_key call returns when key_gates[n] is set (if there is one).
+    """
+
+    def __init__(self, data_gates, key_gates):
+        self.data_gates = data_gates
+        self.key_gates = key_gates
+        self.data_calls = 0
+        self.key_calls = 0
+        self.lock = threading.Lock()
+
+    def get_request_key(self, name, *args, **kwargs):
+        with self.lock:
+            n, self.key_calls = self.key_calls, self.key_calls + 1
+
+        if n in self.key_gates:
+            self.key_gates[n].wait(5)
+
+        return (1, (name, args))
+
+    def get_data(self, tickers, field):
+        with self.lock:
+            n, self.data_calls = self.data_calls, self.data_calls + 1
+
+        self.data_gates[n].wait(5)
+
+        return [n]
+
+
+def test_async_client_back_to_back_bursts():
+    data_gates = [threading.Event() for _ in range(3)]
+    key_release = threading.Event()
+    stub = GatedAPI(data_gates, {2: key_release})
+
+    async def run():
+        client = AsyncFinancialDataAPI(stub, max_workers=4)
+
+        # the first burst is in flight
+        first = [asyncio.ensure_future(client.get_data('A', 'Close')) for _ in range(2)]
+        await asyncio.sleep(0.1)
+
+        # the second burst has its key as the first query finishes: the first query is done,
+        # but its entry is only removed by its done callback, which runs after the second burst starts a new query
+        second = asyncio.ensure_future(client.get_data('A', 'Close'))
+        await asyncio.sleep(0.1)
+
+        key_release.set()
+        time.sleep(0.1)
+        data_gates[0].set()
+        time.sleep(0.1)
+        await asyncio.sleep(0.1)
+
+        # an identical query arriving while the second one is in flight joins it
+        third = asyncio.ensure_future(client.get_data('A', 'Close'))
+        await asyncio.sleep(0.1)
+        data_gates[1].set()
+        data_gates[2].set()
+
+        results = await asyncio.gather(*first, second, third)
+        await client.close()
+
+        return results, client.get_stats()
+
+    results, stats = asyncio.run(run())
+
+    assert results == [[0], [0], [1], [1]]
+    assert stub.data_calls == 2
+    assert stats == {'calls': 4, 'coalesced': 2, 'in_flight': 0}
+
+
+def test_registry_does_not_read_a_changed_file(tmp_path):
+    path = tmp_path / 'data.csv'
+    path.write_text('a;b\n1;2\n')
+
+    def signature(path):
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+
+    registry = DataSetRegistry({'data': str(path)}, lambda path: pd.read_csv(path, sep=';'), signature)
+    changed = DataSetRegistry({'data': str(path)}, lambda path: pd.read_csv(path, sep=';'), signature)
+
+    assert registry['data']['a'].tolist() == [1]
+
+    # the file is rewritten after the registries were created
+    path.write_text('a;b\n1;2\n3;4\n')
+
+    assert registry['data']['a'].tolist() == [1]
+
+    with pytest.raises(DataSetChangedError):
+        changed['data']
+
+    assert DataSetRegistry({'data': str(path)}, lambda path: pd.read_csv(path, sep=';'), signature)['data']['a'].tolist() == [1, 3]
+
+
+def test_changed_file_is_refreshed_on_first_read(api, source, tmp_path, tickers):
+    changed = str(tmp_path / 'changed')
+    shutil.copytree(source, changed)
+    api.reload_data_sets_and_meta(changed)
+    generation = api.get_data_generation()
+    as_of_date = '{}-12-31'.format(START_YEAR + 2)
+    params = dict(as_of_date_start=as_of_date, as_of_date_end=as_of_date)
+
+    def update(file_name):
+        # the daily update rewrites a statement in place, nobody calls refresh_data_sets
+        statement = read_csv(changed, file_name)
+        statement['Revenue'] = statement['Revenue'] * 2
+        statement.to_csv(os.path.join(changed, file_name), sep=';', index=False, date_format='%Y-%m-%d')
+
+        return offset_reports(statement, tickers, as_of_date, 0, 0)['Revenue']
+
+    close = api.get_data(tickers, 'Close', start='2017-01-01', end='2017-01-31')
+
+    # the first query reading a changed data set refreshes the data sets and reads the updated file
+    expected = update('us-income-annual.csv')
+    assert_values(api.get_data(tickers, 'Revenue', pt='a', **params)['Revenue'], expected)
+    assert api.get_data_generation() == generation + 1
+
+    # so does the first chunk of iter_data
+    expected = update('us-income-ttm.csv')
+    chunks = list(api.iter_data(tickers, 'Revenue', chunk_size=3, pt='ttm', **params))
+    assert_values(pd.concat(chunks)['Revenue'], expected)
+    assert api.get_data_generation() == generation + 2
+
+    # the data sets read before the updates are unchanged
+    pd.testing.assert_frame_equal(api.get_data(tickers, 'Close', start='2017-01-01', end='2017-01-31'), close)
+
+
+def test_result_cache_evicts_the_least_recently_used():
+    value = pd.DataFrame({'a': np.arange(100, dtype=np.float64)})
+    size = ResultCache.size_of(value)
+    cache = ResultCache(3 * size)
+
+    for key in 'abc':
+        cache.put(key, value)
+
+    assert cache.get('a')[0]
+    cache.put('d', value)
+
+    # b was used the longest time ago
+    assert [cache.get(key)[0] for key in 'acd'] == [True, True, True]
+    assert cache.get('b') == (False, None)
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions'], stats['entries']) == (4, 1, 1, 3)
+    assert stats['bytes'] == 3 * size
+
+    # a value larger than the budget is not stored
+    cache.put('e', pd.DataFrame({'a': np.arange(1000, dtype=np.float64)}))
+    assert not cache.get('e')[0]
+    assert cache.stats()['entries'] == 3
+
+
+def test_result_cache_copies_values():
+    cache = ResultCache(1 << 20)
+    df = pd.DataFrame({'a': [1.0, 2.0]})
+    tickers = ['A', 'B']
+
+    cache.put('df', df)
+    cache.put('list', tickers)
+
+    # the caller changes the values it stored and the values it got
+    df.loc[0, 'a'] = 100
+    tickers.append('C')
+    cache.get('df')[1].loc[1, 'a'] = 200
+    cache.get('list')[1].append('D')
+
+    assert cache.get('df')[1]['a'].tolist() == [1.0, 2.0]
+    assert cache.get('list')[1] == ['A', 'B']
+
+
+def test_result_cache_of_the_api(api, source, tmp_path, tickers):
+    cached = str(tmp_path / 'cached')
+    shutil.copytree(source, cached)
+    api.reload_data_sets_and_meta(cached)
+    params = dict(start='2017-01-01', end='2017-01-31', adj='n')
+
+    api.enable_result_cache()
+
+    try:
+        df = api.get_data(tickers, 'Close', **params)
+        df.loc[:, 'Close'] = 0
+        universe = api.get_all_tickers(date(2017, 1, 31))
+        universe.clear()
+
+        # the results changed by the caller are not the cached ones
+        assert api.get_data(tickers, 'Close', **params)['Close'].max() > 0
+        assert len(api.get_all_tickers(date(2017, 1, 31)))
+        assert api.get_result_cache_stats()['hits'] == 2
+        assert api.get_result_cache_stats()['misses'] == 2
+
+        # a reload drops the cached results
+        api.reload_data_sets_and_meta(cached)
+        assert api.get_result_cache_stats()['entries'] == 0
+
+        expected = api.get_data(tickers, 'Close', **params)
+        assert api.get_result_cache_stats()['misses'] == 3
+
+        # so does a refresh which changed the data
+        price_file = os.path.join(cached, 'us-shareprices-daily.csv')
+        prices = read_csv(cached, 'us-shareprices-daily.csv')
+        prices['Close'] = prices['Close'] * 2
+        prices.to_csv(price_file, sep=';', index=False, date_format='%Y-%m-%d')
+
+        assert api.refresh_data_sets()['shareprices-daily'] == 'reloaded'
+        assert api.get_result_cache_stats()['entries'] == 0
+        assert_values(api.get_data(tickers, 'Close', **params)['Close'], expected['Close'] * 2)
+
+        # a refresh without changes keeps them
+        api.refresh_data_sets()
+        api.get_data(tickers, 'Close', **params)
+        assert api.get_result_cache_stats()['hits'] == 3
+    finally:
+        api.disable_result_cache()
+
+
+def test_shared_store(api, source, tmp_path, tickers):
+    published = str(tmp_path / 'published')
+    store = str(tmp_path / 'store')
+    shutil.copytree(source, published)
+
+    queries = [
+        ('get_data', (tickers, ['Close', 'Volume']), dict(start='2017-01-01', end='2017-03-31', adj='n', fill_prev='y')),
+        ('get_data', (tickers, 'Revenue'), dict(pt='q', offset_start=-1, offset_end=0, as_of_date_start='2017-06-30', as_of_date_end='2017-06-30')),
+        ('get_all_tickers', (date(2017, 6, 30),), {}),
+    ]
+
+    def direct():
+        api.reload_data_sets_and_meta(published)
+        return [getattr(api, name)(*args, **kwargs) for name, args, kwargs in queries]
+
+    def update():
+        prices = read_csv(published, 'us-shareprices-daily.csv')
+        prices['Close'] = prices['Close'] * 2
+        prices.to_csv(os.path.join(published, 'us-shareprices-daily.csv'), sep=';', index=False, date_format='%Y-%m-%d')
+
+    async def attached(client):
+        return await asyncio.gather(*[getattr(client, name)(*args, **kwargs) for name, args, kwargs in queries])
+
+    def assert_results(actual, expected):
+        for actual_result, expected_result in zip(actual, expected):
+            if isinstance(expected_result, pd.DataFrame):
+                pd.testing.assert_frame_equal(actual_result, expected_result)
+            else:
+                assert actual_result == expected_result
+
+    assert api.publish_shared(store, published, keep=2) == 0
+
+    async def run():
+        # a worker process attaches the store, it switches to a new generation through the CURRENT file
+        async with AsyncFinancialDataAPI(shared=store, processes=True, max_workers=1) as client:
+            results = [await attached(client)]
+
+            update()
+            assert api.publish_shared(store, published, keep=2) == 1
+            results.append(await attached(client))
+
+            update()
+            assert api.publish_shared(store, published, keep=2) == 2
+            results.append(await attached(client))
+
+            return results
+
+    results = asyncio.run(run())
+
+    with open(os.path.join(store, 'CURRENT')) as f:
+        assert f.read() == '2'
+
+    # the generations older than the last keep ones are deleted
+    assert sorted(d for d in os.listdir(store) if d.startswith('gen-')) == ['gen-1', 'gen-2']
+
+    assert_results(results[2], direct())
+    assert_values(results[1][0]['Close'], results[0][0]['Close'] * 2)
+    assert_values(results[2][0]['Close'], results[0][0]['Close'] * 4)
+    assert_results(results[1][1:], results[0][1:])